@@ -0,0 +1,3 @@
+"""
+benchmarks -> Offline benchmarks of searching, downloading & sorting, see `benchmarks/run.py`.
+"""
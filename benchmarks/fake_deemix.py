@@ -0,0 +1,81 @@
+"""
+fake_deemix.py -> Stands in for `deemix` in the benchmarks: prints what Deemix prints and writes a fake FLAC at a set rate.
+
+Usage:
+    python benchmarks/fake_deemix.py [--size BYTES] [--rate BYTES_PER_SECOND] [--tracks N] --portable LINK --path DIR --bitrate FLAC
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import fake_flac
+
+CHUNK = 64 * 1024
+
+
+def download(path: str, name: str, size: int, rate: float) -> None:
+    """Writes one track, as fast as `rate` allows, printing the progress lines Deemix would."""
+    listener = uuid.uuid4().hex[:8]
+    print(f"[{listener}] {name} :: Getting tags.", flush=True)
+    print(f"[{listener}] {name} :: Downloading track. Downloading {size} bytes.", flush=True)
+    # the padding stands in for the audio's size, so a killed download leaves a cut off file like Deemix would
+    data = fake_flac(*name.split(" - ", 1), duration=180, padding=size, audio=True)
+    size = len(data)
+    started = time.monotonic()
+    written = 0
+    last_percent = 0
+    with open(os.path.join(path, f"{name}.flac"), 'wb') as f:
+        while written < size:
+            chunk = min(CHUNK, size - written)
+            f.write(data[written:written + chunk])
+            f.flush()
+            written += chunk
+            if rate > 0:
+                # sleep until the rate catches up with what's been written
+                ahead = written / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            percent = written * 100 // size
+            if percent >= last_percent + 10 or written == size:
+                last_percent = percent
+                print(f"[{listener}] Download at {percent}%", flush=True)
+    print(f"[{listener}] {name} :: Track downloaded.", flush=True)
+    # like `deemix.utils.formatListener`: relative to the download's folder (the album's, for albums)
+    print(f"[{listener}] Completed download of /{name}.flac", flush=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("link")
+    parser.add_argument("--portable", action="store_true")
+    parser.add_argument("--path", default="./music/")
+    parser.add_argument("--bitrate", default="FLAC")
+    parser.add_argument("--size", type=int, default=2_000_000, help="bytes per track")
+    parser.add_argument("--rate", type=float, default=20_000_000, help="bytes per second, 0 for unlimited")
+    parser.add_argument("--tracks", type=int, default=10, help="tracks of an album")
+    args = parser.parse_args()
+
+    match = re.search(r"/(track|album|playlist)/(\d+)", args.link)
+    if match is None:
+        print(f"Link not recognized: {args.link}", flush=True)
+        return 1
+    kind, value = match.groups()
+    os.makedirs(args.path, exist_ok=True)
+    if kind == "track":
+        download(args.path, f"Artist {value} - Song {value}", args.size, args.rate)
+        return 0
+    folder = os.path.join(args.path, f"Artist {value} - Album {value}")
+    os.makedirs(folder, exist_ok=True)
+    for track in range(args.tracks):
+        download(folder, f"Artist {value} - Song {value}-{track:02d}", args.size, args.rate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+fixtures.py -> Fake FLAC files & synthetic music libraries for the benchmarks.
+"""
+
+import os
+import struct
+
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 4096
+
+
+def _crc(data: bytes, poly: int, bits: int) -> int:
+    crc = 0
+    top, mask = 1 << (bits - 1), (1 << bits) - 1
+    for byte in data:
+        crc ^= byte << (bits - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & mask if crc & top else (crc << 1) & mask
+    return crc
+
+
+def flac_audio(duration: float) -> bytes:
+    """
+    Valid FLAC frames of silence (a constant subframe per channel), 16 bit stereo at `SAMPLE_RATE`.
+
+    Args:
+        duration (float): Seconds.
+
+    Returns:
+        bytes: The frames, to go after the metadata.
+    """
+    samples = int(duration * SAMPLE_RATE)
+    frames = []
+    for number, start in enumerate(range(0, samples, BLOCK_SIZE)):
+        size = min(BLOCK_SIZE, samples - start)
+        # frame numbers are coded like UTF-8
+        if number < 0x80:
+            coded = bytes([number])
+        elif number < 0x800:
+            coded = bytes([0xC0 | number >> 6, 0x80 | number & 0x3F])
+        else:
+            coded = bytes([0xE0 | number >> 12, 0x80 | (number >> 6) & 0x3F, 0x80 | number & 0x3F])
+        # block size 4096 (or 16 bits at the end), 44.1kHz, 2 channels, 16 bits
+        if size == BLOCK_SIZE:
+            header = b"\xff\xf8\xc9\x18" + coded
+        else:
+            header = b"\xff\xf8\x79\x18" + coded + (size - 1).to_bytes(2, "big")
+        header += bytes([_crc(header, 0x07, 8)])
+        frame = header + b"\x00\x00\x00" * 2
+        frames.append(frame + _crc(frame, 0x8005, 16).to_bytes(2, "big"))
+    return b"".join(frames)
+
+
+def fake_flac(artist: str, title: str, album: str = "", duration: float = 180, padding: int = 1024, audio: bool = False) -> bytes:
+    """
+    A FLAC file with a real STREAMINFO & Vorbis comment (so tag readers are happy) but no audio,
+    or with `audio` silent frames which pass `lib.verify.check_file()`.
+
+    Args:
+        artist (str): The ARTIST tag.
+        title (str): The TITLE tag.
+        album (str): Optional. The ALBUM tag.
+        duration (float): Defaults to 180. Seconds, written into STREAMINFO.
+        padding (int): Defaults to 1024. Zero bytes standing in for the audio (in a PADDING block if `audio`).
+        audio (bool): Defaults to False. If True, end with real frames (see `flac_audio()`).
+
+    Returns:
+        bytes: The file.
+    """
+    samples = int(duration * SAMPLE_RATE)
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1, 36 bits total samples
+    packed = (SAMPLE_RATE << 44) | (1 << 41) | (15 << 36) | samples
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\x00" * 6 + struct.pack(">Q", packed) + b"\x00" * 16
+
+    comments = [f"ARTIST={artist}", f"TITLE={title}"] + ([f"ALBUM={album}"] if album else [])
+    vendor = b"benchmarks"
+    vorbis = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(comments))
+    for comment in comments:
+        comment = comment.encode()
+        vorbis += struct.pack("<I", len(comment)) + comment
+
+    def block(kind: int, data: bytes, last: bool = False) -> bytes:
+        return bytes([kind | (0x80 if last else 0)]) + len(data).to_bytes(3, "big") + data
+
+    if audio:
+        return b"fLaC" + block(0, streaminfo) + block(4, vorbis) + block(1, b"\x00" * padding, last=True) + flac_audio(duration)
+    return b"fLaC" + block(0, streaminfo) + block(4, vorbis, last=True) + b"\x00" * padding
+
+
+def make_library(
+    music_dir: str,
+    files: int = 10000,
+    artists: int = 500,
+    album_ratio: float = 0.2,
+    sorted_ratio: float = 0.0
+) -> int:
+    """
+    Writes a synthetic library of tiny FLACs, shaped like what Deemix leaves behind.
+
+    Args:
+        music_dir (str): Where to write it.
+        files (int): Defaults to 10000. Amount of songs.
+        artists (int): Defaults to 500. Amount of artists they're spread over.
+        album_ratio (float): Defaults to 0.2. Share of the songs inside an "%artist% - %album%" folder instead of loose.
+        sorted_ratio (float): Defaults to 0. Share of the songs already inside their artist folder (sorted before).
+
+    Returns:
+        int: The amount of files written.
+    """
+    os.makedirs(music_dir, exist_ok=True)
+    albums = int(files * album_ratio)
+    already_sorted = int(files * sorted_ratio)
+    for index in range(files):
+        artist = f"Artist {index % artists:04d}"
+        title = f"Song {index:05d}"
+        album = f"Album {index % artists:04d}-{index // (artists * 10)}"
+        if index < already_sorted:
+            folder = os.path.join(music_dir, artist)
+        elif index < already_sorted + albums:
+            folder = os.path.join(music_dir, f"{artist} - {album}")
+        else:
+            folder = music_dir
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{artist} - {title}.flac"), 'wb') as f:
+            f.write(fake_flac(artist=artist, title=title, album=album))
+    return files
@@ -0,0 +1,188 @@
+"""
+mock_deezer.py -> A local stand in for the Deezer API (`/search`, `/track`, `/album` & `gw-light.php`), with added latency & throttling.
+"""
+
+import json
+import time
+import threading
+
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# the account `Dzr.account_info()` gets back
+ACCOUNT = {
+    "results": {
+        "USER": {
+            "FIRSTNAME": "Bench",
+            "LASTNAME": "Mark",
+            "EMAIL": "bench@example.com",
+            "OPTIONS": {"web_lossless": True},
+            "TRY_AND_BUY": {"DATE_START": "2024-01-01 00:00:00", "DATE_END": "2030-01-01 00:00:00"},
+        },
+        "OFFER_NAME": "Deezer Premium",
+        "COUNTRY": "GB",
+    }
+}
+
+
+def _track(index: int, title: str, artist: str) -> dict:
+    return {
+        "id": index,
+        "type": "track",
+        "link": f"https://www.deezer.com/track/{index}",
+        "title": title,
+        "duration": 180,
+        "artist": {"name": artist},
+        "album": {"id": 100000 + index, "title": f"{title} (Album)"},
+    }
+
+
+class MockDeezer:
+    """
+    Answers like the Deezer API, from a thread of its own.
+
+    Args:
+        latency (float): Defaults to 0.02. Seconds added to every response.
+        throttle (float): Defaults to 0. Requests per second above which the quota error is sent back (as Deezer does). 0 never throttles.
+        not_found (float): Defaults to 0.05. Share of searches which find nothing.
+        results (int): Defaults to 10. Amount of results of a search.
+        playlist_size (int): Defaults to 2000. Tracks of every playlist (and albums of every artist), can be changed while running.
+    """
+    def __init__(
+        self,
+        latency: float = 0.02,
+        throttle: float = 0,
+        not_found: float = 0.05,
+        results: int = 10,
+        playlist_size: int = 2000
+    ) -> None:
+        self.latency = latency
+        self.throttle = throttle
+        self.not_found = not_found
+        self.results = results
+        self.playlist_size = playlist_size
+
+        self.lock = threading.Lock()
+        self.recent = []
+        self.counters = {"requests": 0, "throttled": 0}
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "MockDeezer":
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real API, so the pooled connections are reused
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                self.reply(mock.answer(self.path))
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.reply(mock.answer(self.path))
+
+            def reply(self, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __throttled(self) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            self.counters["requests"] += 1
+            if self.throttle <= 0:
+                return False
+            self.recent = [at for at in self.recent if now - at < 1]
+            if len(self.recent) >= self.throttle:
+                self.counters["throttled"] += 1
+                return True
+            self.recent.append(now)
+            return False
+
+    def answer(self, path: str) -> dict:
+        """The JSON body for a request path."""
+        time.sleep(self.latency)
+        if self.__throttled():
+            return {"error": {"type": "Exception", "message": "Quota limit exceeded", "code": 4}}
+        url = urlsplit(path)
+        parts = url.path.strip("/").split("/")
+        if parts[0] == "search":
+            query = parse_qs(url.query).get("q", [""])[0]
+            # the same query always (not) finds the same thing
+            seed = sum(query.encode())
+            if self.not_found > 0 and seed % 100 < self.not_found * 100:
+                return {"data": [], "total": 0}
+            words = query.split()
+            artist = " ".join(words[:2]) or "Bench"
+            title = " ".join(words[2:]) or query
+            data = [_track(seed * 100 + index, title if index == 0 else f"{title} {index}", artist) for index in range(self.results)]
+            return {"data": data, "total": len(data)}
+        if parts[0] == "track" and len(parts) == 2:
+            value = parts[1].removeprefix("isrc:")
+            return _track(sum(value.encode()), f"Song {value}", "Artist ISRC")
+        if parts[0] == "playlist" and len(parts) == 2:
+            # the checksum changes with the tracks, like Deezer's
+            return {"id": parts[1], "nb_tracks": self.playlist_size, "checksum": f"{parts[1]}-{self.playlist_size}"}
+        if parts[0] == "artist" and len(parts) == 2:
+            return {"id": parts[1], "name": f"Artist {parts[1]}", "nb_album": self.playlist_size}
+        if parts[0] in ("playlist", "artist") and len(parts) == 3:
+            query = parse_qs(url.query)
+            index, limit = int(query.get("index", ["0"])[0]), int(query.get("limit", ["25"])[0])
+            items = range(index, min(index + limit, self.playlist_size))
+            if parts[0] == "playlist":
+                data = [_track(int(parts[1]) * 100000 + item, f"Song {item}", f"Artist {item % 50}") for item in items]
+            else:
+                data = [{"id": int(parts[1]) * 100000 + item, "title": f"Album {item}"} for item in items]
+            return {"data": data, "total": self.playlist_size}
+        if parts[0] == "album" and len(parts) == 2:
+            return {"id": parts[1], "nb_tracks": 10}
+        if url.path.endswith("gw-light.php"):
+            return ACCOUNT
+        return {"error": {"type": "DataException", "message": "no data", "code": 800}}
+
+    def mount(self, session: requests.Session, pool_maxsize: int = 10) -> None:
+        """Sends every https:// request of the session (so every Deezer one) to this mock instead."""
+        session.mount("https://", _RedirectAdapter(self.url, pool_connections=4, pool_maxsize=pool_maxsize))
+
+    def __enter__(self) -> "MockDeezer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class _RedirectAdapter(HTTPAdapter):
+    """Rewrites the host of every request to the mock, keeping the path & query."""
+    def __init__(self, base: str, **kwargs) -> None:
+        self.base = base
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        url = urlsplit(request.url)
+        request.url = self.base + url.path + (f"?{url.query}" if url.query else "")
+        return super().send(request, **kwargs)
@@ -0,0 +1,378 @@
+"""
+run.py -> Runs the benchmarks offline (against `MockDeezer` & `fake_deemix.py`) and writes the results as JSON.
+
+Usage (from the root of the repo):
+    python -m benchmarks.run [--only search,download,sort] [--output results.json] [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from typing import Callable, Optional
+
+from rich.table import Table
+from rich.console import Console
+
+from lib.dzr import Dzr
+from lib.ss import SmartSort
+from lib.cache import SearchCache
+from lib.library import LibraryIndex
+from lib.metrics import METRICS
+from lib.ratelimit import RateLimiter
+from lib.scheduler import DownloadScheduler, OK
+from lib.verify import Verifier
+
+from benchmarks.fixtures import make_library
+from benchmarks.mock_deezer import MockDeezer
+
+FAKE_DEEMIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_deemix.py")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+console = Console()
+
+
+def _timed(function: Callable) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def _dzr(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> Dzr:
+    """A `Dzr` talking to the mock, downloading with the fake deemix, keeping everything inside the workspace."""
+    music_dir = os.path.join(workspace, "music") + os.sep
+    dzr = Dzr(
+        music_dir=music_dir,
+        timeout=30,
+        max_workers=args.workers,
+        cache=SearchCache(path=os.path.join(workspace, "config", "search_cache.db"))
+    )
+    mock.mount(dzr.session, pool_maxsize=max(10, args.workers))
+    dzr.limiter = RateLimiter(rate=args.rate, burst=max(1, int(args.rate)))
+    dzr.download_query = (
+        f"{sys.executable} {FAKE_DEEMIX} --size {args.track_size} --rate {args.download_rate} "
+        f"--portable {{}} --path {music_dir} --bitrate FLAC"
+    )
+    return dzr
+
+
+def bench_startup(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """How long `import main` and `Main()` take in a fresh interpreter (the best of 5), checked against `args.import_budget`."""
+    code = (
+        f"import sys, time; sys.path.insert(0, {ROOT!r}); started = time.perf_counter(); import main; "
+        "imported = time.perf_counter(); main.Main(); print(imported - started, time.perf_counter() - imported)"
+    )
+    timings = []
+    for _ in range(5):
+        output = subprocess.run([sys.executable, "-c", code], cwd=workspace, capture_output=True, text=True, check=True).stdout
+        timings.append([float(value) for value in output.split()])
+    imported = min(timing[0] for timing in timings) * 1000
+    initialised = min(timing[1] for timing in timings) * 1000
+
+    # the modules `main` imports directly, by how long each (and everything it imports) took
+    report = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=workspace, capture_output=True, text=True, check=True
+    ).stderr
+    slowest = []
+    for line in report.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # a module is printed once it's done, after what it imported itself
+        if not parts[2].startswith("  ") and parts[2].strip() != "main":
+            # e.g. `site`, what came before it wasn't imported by `main`
+            slowest.clear()
+        elif parts[2].startswith("   ") and not parts[2].startswith("    "):
+            slowest.append({"module": parts[2].strip(), "ms": round(int(parts[1]) / 1000, 2)})
+    slowest.sort(key=lambda module: module["ms"], reverse=True)
+    return {
+        "import_ms": round(imported, 2),
+        "init_ms": round(initialised, 2),
+        "budget_ms": args.import_budget,
+        "over_budget": imported + initialised > args.import_budget,
+        "slowest": slowest[:5],
+    }
+
+
+def bench_search(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """`Dzr.search_many` over `args.queries` queries, first with an empty cache then again with it full."""
+    dzr = _dzr(args, mock, workspace)
+    dzr.cache.clear()
+    queries = [f"artist{index % 97} band song number {index}" for index in range(args.queries)]
+    requests_before = mock.counters["requests"]
+    cold, results = _timed(lambda: dzr.search_many(queries))
+    requests_cold = mock.counters["requests"] - requests_before
+    warm, _ = _timed(lambda: dzr.search_many(queries))
+    single, _ = _timed(lambda: [dzr.search(query) for query in queries[:50]])
+    return {
+        "queries": len(queries),
+        "cold_seconds": round(cold, 4),
+        "cold_queries_per_second": round(len(queries) / cold, 2),
+        "warm_seconds": round(warm, 4),
+        "warm_queries_per_second": round(len(queries) / warm, 2),
+        "single_cached_ms": round(single / min(50, len(queries)) * 1000, 3),
+        "not_found": sum(result is None for result in results),
+        "http_requests": requests_cold,
+        "limiter": dzr.limiter.stats(),
+    }
+
+
+def bench_download(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """
+    `DownloadScheduler` running `Dzr.download_status` (with the fake deemix) over `args.downloads` links,
+    each checked by a `Verifier` unless --no-verify.
+    """
+    dzr = _dzr(args, mock, workspace)
+    verifier = None if args.no_verify else Verifier(dzr=dzr, workers=args.download_workers)
+    links = [
+        f"https://www.deezer.com/en/album/{index}" if index % 10 == 9 else f"https://www.deezer.com/track/{index}"
+        for index in range(args.downloads)
+    ]
+    dzr.progress.reset()
+    scheduler = DownloadScheduler(
+        download=dzr.download_status,
+        workers=args.download_workers,
+        retries=0,
+        verify=verifier.verify if verifier is not None else None
+    )
+    seconds, results = _timed(lambda: scheduler.run(links))
+    if verifier is not None:
+        verifier.close()
+    written = 0
+    for root, _, files in os.walk(dzr.music_dir):
+        written += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+    shutil.rmtree(dzr.music_dir, ignore_errors=True)
+    return {
+        "links": len(links),
+        "workers": args.download_workers,
+        "seconds": round(seconds, 4),
+        "links_per_second": round(len(links) / seconds, 2),
+        "mb_per_second": round(written / seconds / 1_000_000, 2),
+        "ok": sum(result == OK for result in results.values()),
+        "bytes": written,
+        "verified": verifier is not None,
+        # so a file which can't be found (and is skipped) shows up here
+        "files_checked": sum(
+            counter["value"] for counter in METRICS.snapshot()["counters"]
+            if counter["name"] == "verify_files_total" and counter["labels"].get("result") == "ok"
+        ),
+    }
+
+
+def bench_library(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """`LibraryIndex.refresh` of a synthetic library, from nothing and then with nothing changed."""
+    music_dir = os.path.join(workspace, "library")
+    generated, _ = _timed(lambda: make_library(music_dir, files=args.files))
+    index = LibraryIndex(music_dir=music_dir, path=os.path.join(workspace, "config", "library.db"))
+    cold, changed = _timed(index.refresh)
+    warm, _ = _timed(index.refresh)
+    shutil.rmtree(music_dir, ignore_errors=True)
+    return {
+        "files": args.files,
+        "generate_seconds": round(generated, 4),
+        "cold_seconds": round(cold, 4),
+        "cold_files_per_second": round(len(changed) / cold, 2),
+        "warm_seconds": round(warm, 4),
+    }
+
+
+def bench_sort(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """`SmartSort.sort` of a synthetic library, then again with nothing new in it."""
+    music_dir = os.path.join(workspace, "sort")
+    make_library(music_dir, files=args.files)
+    ss = SmartSort(music_dir=music_dir, state_file=os.path.join(workspace, "config", "ss_state.json"))
+    ss.console = Console(quiet=True)
+    cold, moved = _timed(ss.sort)
+    warm, _ = _timed(ss.sort)
+    shutil.rmtree(music_dir, ignore_errors=True)
+    return {
+        "files": args.files,
+        "cold_seconds": round(cold, 4),
+        "moved": len(moved),
+        "moves_per_second": round(len(moved) / cold, 2),
+        "warm_seconds": round(warm, 4),
+    }
+
+
+def bench_account(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """`Dzr.account_info` a few times over, as the menu does: the first call asks Deezer, the rest are cached."""
+    dzr = _dzr(args, mock, workspace)
+    calls = 20
+    first, _ = _timed(dzr.account_info)
+    seconds, _ = _timed(lambda: [dzr.account_info() for _ in range(calls)])
+    return {
+        "calls": calls,
+        "first_ms": round(first * 1000, 3),
+        "seconds": round(seconds, 4),
+        "ms_per_call": round(seconds / calls * 1000, 3),
+    }
+
+
+def bench_sync(args: argparse.Namespace, mock: MockDeezer, workspace: str) -> dict:
+    """
+    `Dzr.expand` of a playlist of `args.playlist` tracks: listed from nothing, again with nothing changed,
+    then with 5 tracks added (what `Main.sync` pays before diffing against the journal & library).
+    """
+    dzr = _dzr(args, mock, workspace)
+    link = "https://www.deezer.com/en/playlist/42"
+    original, mock.playlist_size = mock.playlist_size, args.playlist
+
+    def listed() -> tuple[float, int, int]:
+        before = mock.counters["requests"]
+        seconds, entries = _timed(lambda: dzr.expand(link))
+        return seconds, len(entries), mock.counters["requests"] - before
+
+    cold, tracks, cold_requests = listed()
+    unchanged, _, unchanged_requests = listed()
+    mock.playlist_size = args.playlist + 5
+    added, added_tracks, added_requests = listed()
+    mock.playlist_size = original
+    return {
+        "tracks": tracks,
+        "cold_seconds": round(cold, 4),
+        "cold_requests": cold_requests,
+        "unchanged_seconds": round(unchanged, 4),
+        "unchanged_requests": unchanged_requests,
+        "added_seconds": round(added, 4),
+        "added_requests": added_requests,
+        "added_tracks": added_tracks - tracks,
+    }
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "search": bench_search,
+    "download": bench_download,
+    "library": bench_library,
+    "sort": bench_sort,
+    "account": bench_account,
+    "sync": bench_sync,
+}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares every "*seconds" result against a baseline run.
+
+    Args:
+        results (dict): This run.
+        baseline (dict): An earlier run, as written by `--output`.
+        tolerance (float): How much slower (0.2 = 20%) a result may be before it counts as a regression.
+
+    Returns:
+        list[str]: The regressions, empty if there were none.
+    """
+    regressions = []
+    table = Table(title=f"Compared to {baseline.get('commit') or 'the baseline'}.")
+    table.add_column("Result", justify="left")
+    table.add_column("Before", justify="right")
+    table.add_column("Now", justify="right")
+    table.add_column("Change", justify="right")
+    for name, values in results["results"].items():
+        before = baseline.get("results", {}).get(name, {})
+        for key, value in values.items():
+            if not key.endswith("seconds") or not before.get(key):
+                continue
+            change = (value - before[key]) / before[key]
+            style = "red" if change > tolerance else "green" if change < -tolerance else ""
+            table.add_row(f"{name}.{key}", f"{before[key]:g}", f"{value:g}", f"[{style}]{change:+.0%}" if style else f"{change:+.0%}")
+            if change > tolerance:
+                regressions.append(f"{name}.{key}: {before[key]:g}s -> {value:g}s ({change:+.0%})")
+    console.print(table)
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks, against a mock Deezer API and a fake deemix.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated benchmarks to run")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown counted as a regression by --compare")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8, help="search workers")
+    parser.add_argument("--rate", type=float, default=200, help="requests per second allowed by the rate limiter")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the mock API takes per request")
+    parser.add_argument("--throttle", type=float, default=0, help="requests per second above which the mock throttles, 0 for never")
+    parser.add_argument("--downloads", type=int, default=40)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--track-size", type=int, default=2_000_000, help="bytes of each fake track")
+    parser.add_argument("--no-verify", action="store_true", help="don't check the downloads with `lib.verify.Verifier`")
+    parser.add_argument("--download-rate", type=float, default=20_000_000, help="bytes per second of each fake deemix")
+    parser.add_argument("--playlist", type=int, default=2000, help="tracks of the playlist synced")
+    parser.add_argument("--files", type=int, default=10000, help="songs in the synthetic libraries")
+    parser.add_argument("--import-budget", type=float, default=150, help="milliseconds `import main` + `Main()` may take")
+    parser.add_argument("--keep", action="store_true", help="keep the workspace instead of removing it")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    workspace = tempfile.mkdtemp(prefix="dzr-bench-")
+    cwd = os.getcwd()
+    results = {
+        "version": 1,
+        "time": time.time(),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep")},
+        "results": {},
+    }
+    try:
+        # the relative paths (e.g. "config/.arl") point into the workspace, never at the real config
+        os.chdir(workspace)
+        os.makedirs("config", exist_ok=True)
+        with open("config/.arl", 'w') as f:
+            f.write("0" * 192)
+        with MockDeezer(latency=args.latency, throttle=args.throttle) as mock:
+            for name in names:
+                with console.status(f"[yellow]Running {name}..."):
+                    METRICS.reset()
+                    results["results"][name] = BENCHMARKS[name](args, mock, workspace)
+                console.print(f"[green]{name}[reset] {json.dumps(results['results'][name])}")
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            console.print(f"Kept the workspace at {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+    code = 0
+    startup = results["results"].get("startup")
+    if startup is not None and startup["over_budget"]:
+        console.print(f"[b red]Starting up took {startup['import_ms'] + startup['init_ms']:.1f}ms, over the {args.import_budget:g}ms budget!")
+        code = 1
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            console.print("[b red]Regressions:[reset]\n" + "\n".join(regressions))
+            code = 1
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,13 @@
+from lib.cache import query_key
+
 with open('songs.txt', 'r') as f:
     data = f.read()
 
-lines = [line for line in data.splitlines() if line.strip()]
+# drop the blank lines, and the lines which only differ from an earlier one by case, spacing or "feat." variants
+lines = {}
+for line in data.splitlines():
+    if line.strip():
+        lines.setdefault(query_key(line.strip()), line.strip())
 with open('songs.txt', 'w') as f:
-    for line in lines:
-        f.write(f"{line}\n")
\ No newline at end of file
+    for line in lines.values():
+        f.write(f"{line}\n")
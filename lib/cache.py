@@ -0,0 +1,169 @@
+"""
+cache.py -> On-disk cache for the Deezer search results, so re-running a search doesn't hit the API again.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+
+from typing import Optional
+
+
+# "feat.", "ft", "featuring", ... all become "feat"
+_FEATURING = re.compile(r"\b(?:featuring|feat|ft)\b\.?")
+# the brackets a "(feat. ...)" is usually in, and separators which don't change the search
+_PUNCTUATION = re.compile(r"[()\[\]{},;]")
+
+# seconds an entry's "last used" time can be behind before a hit writes it again, so most hits are only a read
+TOUCH_AFTER = 60
+# inserts between two evictions, so a set is usually only an insert
+EVICT_EVERY = 100
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so that small differences (case, whitespace, "feat." variants, brackets) share
+    the same cache entry, and count as the same line.
+
+    Args:
+        query (str): The raw query, as typed in or read from `songs.txt`.
+
+    Returns:
+        str: The normalized query, without the "album" keyword.
+    """
+    query = unicodedata.normalize("NFKC", query).casefold().replace("album", " ")
+    query = _FEATURING.sub(" feat ", query)
+    query = _PUNCTUATION.sub(" ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def query_key(query: str) -> tuple[str, bool]:
+    """
+    What makes two lines of `songs.txt` the same search: the normalized query, and if it's for an album.
+
+    Args:
+        query (str): The raw query.
+
+    Returns:
+        tuple[str, bool]: (normalized query, album)
+    """
+    return (normalize_query(query), "album" in query)
+
+
+class SearchCache:
+    """
+    A small SQLite backed cache of the raw search results, keyed by the normalized query and the album/track mode.
+
+    Args:
+        path (str): Defaults to "config/search_cache.db". Where the cache is stored.
+        ttl (int): Defaults to one day. Seconds a found result is kept for.
+        negative_ttl (int): Defaults to one hour. Seconds a "nothing found" result is kept for.
+        max_entries (int): Defaults to 10000. Once over this, the least recently used entries are evicted
+            (checked every `EVICT_EVERY` inserts, so it can go over by that many in between).
+    """
+    def __init__(
+        self,
+        path: str = "config/search_cache.db",
+        ttl: int = 60 * 60 * 24,
+        negative_ttl: int = 60 * 60,
+        max_entries: int = 10000
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        # one connection shared by the search threads, so every access goes through the lock
+        self.lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL keeps the commits cheap, like the journal & library index
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "query TEXT NOT NULL, mode TEXT NOT NULL, data TEXT NOT NULL, "
+            "expires REAL NOT NULL, used REAL NOT NULL, PRIMARY KEY (query, mode))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        self.conn.commit()
+        # inserts since the last eviction
+        self.inserts = 0
+
+    def get(self, query: str, album: bool) -> Optional[list[dict]]:
+        """
+        Returns the cached results for the query, or None on a miss (or if the entry expired).
+
+        Args:
+            query (str): The raw query.
+            album (bool): If the query was searched for an album.
+
+        Returns:
+            Optional[list[dict]]: The cached "data" of the search, which can be empty for a negative result.
+        """
+        key = (normalize_query(query), "album" if album else "track")
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, expires, used FROM results WHERE query = ? AND mode = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.conn.execute("DELETE FROM results WHERE query = ? AND mode = ?", key)
+                self.conn.commit()
+                return None
+            if now - row[2] > TOUCH_AFTER:
+                self.conn.execute("UPDATE results SET used = ? WHERE query = ? AND mode = ?", (now, *key))
+                self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, query: str, album: bool, data: list[dict]) -> None:
+        """
+        Stores the results for the query. An empty list is stored as a negative result with the shorter TTL.
+
+        Args:
+            query (str): The raw query.
+            album (bool): If the query was searched for an album.
+            data (list[dict]): The "data" of the search response.
+
+        Returns:
+            None
+        """
+        now = time.time()
+        expires = now + (self.ttl if len(data) > 0 else self.negative_ttl)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (query, mode, data, expires, used) VALUES (?, ?, ?, ?, ?)",
+                (normalize_query(query), "album" if album else "track", json.dumps(data), expires, now)
+            )
+            self.inserts += 1
+            if self.inserts >= EVICT_EVERY:
+                self.__evict()
+            self.conn.commit()
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self.lock:
+            self.conn.execute("DELETE FROM results")
+            self.conn.commit()
+
+    def __evict(self) -> None:
+        """Drops expired entries, then the least recently used ones until under `self.max_entries`. Lock must be held."""
+        self.inserts = 0
+        self.conn.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
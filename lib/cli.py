@@ -0,0 +1,165 @@
+"""
+cli.py -> The headless command line, for running from cron or a container without the menu.
+
+    python main.py run --songs songs.txt --bitrate FLAC --workers 8 --sort
+    python main.py daemon --port 8765        (see `lib/daemon.py`)
+    python main.py run --profile [cprofile] [--profile-memory]   (see `lib/profiler.py`)
+
+`run` prints a JSON summary on stdout. Exit codes:
+    0: everything in the songs file was found & downloaded (or already was)
+    1: couldn't run at all (missing songs file, invalid ARL, ...)
+    2: bad arguments
+    3: ran, but some songs weren't found or failed to download
+"""
+
+import sys
+import json
+import argparse
+import contextlib
+
+from typing import Optional
+
+from rich.console import Console
+
+from lib.metrics import METRICS
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="dzr without the menu.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # options every command has
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--bitrate", default="FLAC", help="FLAC | 320 | 128, defaults to FLAC")
+    common.add_argument("--music-dir", default="./music/", help="defaults to ./music/")
+    common.add_argument("--workers", type=int, default=8, help="searches at once, defaults to 8")
+    common.add_argument("--download-workers", type=int, default=4, help="downloads at once, defaults to 4")
+    common.add_argument("--retries", type=int, default=2, help="retries of a failed download, defaults to 2")
+    common.add_argument("--timeout", type=int, default=30, help="seconds a download can go without progress, defaults to 30")
+    common.add_argument("--no-engine", action="store_true", help="start a deemix process per song instead of keeping workers")
+    common.add_argument("--no-verify", action="store_true", help="don't check the downloaded files (and retry the broken ones)")
+    common.add_argument("--bandwidth", type=float, help="MB/s all the downloads may use together, no cap by default")
+    common.add_argument("--verbose", action="store_true", help="show the progress on stderr")
+
+    run = commands.add_parser("run", parents=[common], help="search, download (and sort) everything in the songs file")
+    run.add_argument("--songs", default="songs.txt", help="the songs file, defaults to songs.txt")
+    run.add_argument("--sort", action="store_true", help="run SmartSort once the downloads are done")
+    run.add_argument("--metrics", help="write the metrics here once done (.json for JSON, otherwise Prometheus text)")
+    run.add_argument(
+        "--profile", nargs="?", const="sampling", choices=("sampling", "cprofile"),
+        help="profile the run into config/profiles/ (cprofile adds exact call counts of the main thread)"
+    )
+    run.add_argument("--profile-memory", action="store_true", help="with --profile, trace the allocations too")
+
+    daemon = commands.add_parser("daemon", parents=[common], help="keep running, taking jobs over a local JSON API")
+    daemon.add_argument("--host", default="127.0.0.1", help="defaults to 127.0.0.1")
+    daemon.add_argument("--port", type=int, default=8765, help="defaults to 8765")
+    daemon.add_argument("--socket", help="listen on this Unix socket instead of --host & --port")
+    return parser
+
+
+def main(argv: Optional[list[str]] = None, app: type = None) -> int:
+    """
+    Runs a command.
+
+    Args:
+        argv (list[str]): Optional. The arguments, defaults to `sys.argv[1:]`.
+        app (type): The `Main` class (passed in, since `main.py` is what imports this).
+
+    Returns:
+        int: The exit code.
+    """
+    try:
+        args = build_parser().parse_args(argv)
+    except SystemExit as e:
+        return EXIT_USAGE if e.code else EXIT_OK
+
+    # stdout only ever has the summary on it
+    console = Console(stderr=True) if args.verbose else Console(quiet=True)
+    try:
+        main = app(
+            song_file=getattr(args, "songs", "songs.txt"),
+            bitrate=args.bitrate,
+            music_dir=args.music_dir,
+            workers=max(1, args.workers),
+            download_workers=max(1, args.download_workers),
+            console=console
+        )
+    except OSError as e:
+        # e.g. config/ (for the journal & library index) couldn't be made
+        return _finish({"error": f"could not start: {e}"}, EXIT_ERROR)
+    main.retries = max(0, args.retries)
+    main.timeout = main.dzr.timeout = args.timeout
+    main.use_engine = not args.no_engine
+    main.verify = not args.no_verify
+    main.bandwidth = args.bandwidth * 1_000_000 if args.bandwidth and args.bandwidth > 0 else None
+    if args.command == "daemon":
+        return _daemon(main=main, args=args)
+
+    profiler = None
+    if args.profile:
+        from lib.profiler import Profiler
+        profiler = Profiler(name="run", deterministic=args.profile == "cprofile", memory=args.profile_memory)
+    with profiler or contextlib.nullcontext():
+        try:
+            summary = main.batch(sort=args.sort)
+        except KeyboardInterrupt:
+            main.dzr.stop_engine()
+            main.stop_verifier()
+            summary = {"error": "interrupted"}
+    if profiler is not None:
+        summary["profile"] = profiler.paths
+    if args.metrics:
+        METRICS.write(args.metrics)
+
+    if summary["error"] is not None:
+        code = EXIT_ERROR
+    elif summary["not_found"] + summary["failed"] + summary["timeout"] > 0:
+        code = EXIT_PARTIAL
+    else:
+        code = EXIT_OK
+    return _finish(summary, code)
+
+
+def _daemon(main: object, args: argparse.Namespace) -> int:
+    """Runs `lib.daemon.Daemon` with the warm `Dzr` of `main` until interrupted."""
+    import asyncio
+    from lib.daemon import Daemon
+
+    main.library.refresh()
+    main.warm_up()
+    if main.use_engine and not main.dzr.start_engine(workers=main.download_workers):
+        print(f"Could not start the Deemix workers ({main.dzr.engine_error}), using one process per song.", file=sys.stderr)
+    daemon = Daemon(
+        dzr=main.dzr,
+        library=main.library,
+        download_workers=main.download_workers,
+        retries=main.retries,
+        verify=main.verifier.verify if main.verify else None,
+        bandwidth=main.bandwidth
+    )
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Listening on {where}", file=sys.stderr, flush=True)
+    try:
+        asyncio.run(daemon.serve(host=args.host, port=args.port, socket_path=args.socket))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        # e.g. the port is taken
+        return _finish({"error": f"could not listen on {where}: {e}"}, EXIT_ERROR)
+    finally:
+        main.dzr.stop_engine()
+        main.stop_verifier()
+    return EXIT_OK
+
+
+def _finish(summary: dict, code: int) -> int:
+    """Prints the summary (with its exit code) as one line of JSON."""
+    summary["exit_code"] = code
+    print(json.dumps(summary), file=sys.stdout, flush=True)
+    return code
@@ -0,0 +1,352 @@
+"""
+daemon.py -> Keeps one warm `Dzr` (connections, caches, Deemix workers & download queue) running, taking jobs over a local JSON API.
+
+    POST /jobs            {"type": "search" | "download", "query": "%track% %artist%" | "https://www.deezer.com/...",
+                           "priority": "interactive" | "batch" | <int, lower goes first>}   (priority defaults to "interactive")
+    GET  /jobs            the most recent jobs
+    GET  /jobs/<id>       one job, add ?wait=<seconds> to wait for it to be done
+    GET  /status          the queue, the running downloads and the job counts
+    GET  /metrics         `lib.metrics` in the Prometheus text format
+"""
+
+import json
+import time
+import asyncio
+import itertools
+
+from typing import Callable, Optional
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lib.dzr import Dzr
+from lib.cache import query_key
+from lib.library import LibraryIndex
+from lib.metrics import METRICS
+from lib.scheduler import DownloadScheduler, OK, INTERACTIVE, BATCH
+
+# the kinds of jobs
+SEARCH = "search"
+DOWNLOAD = "download"
+
+# the states a job goes through
+QUEUED = "queued"
+SEARCHING = "searching"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+
+# the names a job's priority can be given by, besides an int
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# biggest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+def is_link(query: str) -> bool:
+    """If the query is a Deezer link rather than something to search for."""
+    return "https://www.deezer.com" in query or "https://deezer.com" in query
+
+
+def job_key(kind: str, query: str) -> tuple[str, str]:
+    """What makes two jobs the same: the same kind, and the same link or (normalized) query."""
+    query = query.strip()
+    if is_link(query):
+        return (kind, query)
+    normalized, album = query_key(query)
+    return (kind, f"{'album:' if album else ''}{normalized}")
+
+
+class Job:
+    """One search or download asked for over the API."""
+    def __init__(self, id: int, kind: str, query: str, priority: int = INTERACTIVE) -> None:
+        self.id = id
+        self.kind = kind
+        self.query = query
+        self.priority = priority
+        self.state = QUEUED
+        self.link = None
+        self.title = None
+        self.result = None
+        self.error = None
+        self.requests = 1
+        self.created = time.time()
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.kind,
+            "query": self.query,
+            "priority": self.priority,
+            "state": self.state,
+            "link": self.link,
+            "title": self.title,
+            "result": self.result,
+            "error": self.error,
+            "requests": self.requests,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class Daemon:
+    """
+    Runs the jobs: searches on a thread pool, downloads through one `DownloadScheduler` shared by every client.
+    A job identical to one still running isn't started again, the running one is handed back instead.
+
+    Args:
+        dzr (Dzr): The (warm) `Dzr` to search & download with.
+        library (LibraryIndex): Optional. If given, songs already in it aren't downloaded again.
+        download_workers (int): Defaults to 4. Downloads at once.
+        retries (int): Defaults to 2. Retries of a failed download.
+        max_jobs (int): Defaults to 1000. Finished jobs kept around for `GET /jobs`.
+        verify (Callable[[str], Future]): Optional. Checks each download, see `DownloadScheduler`.
+        bandwidth (float): Optional. Bytes per second all the downloads may use together, see `DownloadScheduler`.
+    """
+    def __init__(
+        self,
+        dzr: Dzr,
+        library: Optional[LibraryIndex] = None,
+        download_workers: int = 4,
+        retries: int = 2,
+        max_jobs: int = 1000,
+        verify: Optional[Callable[[str], Future]] = None,
+        bandwidth: Optional[float] = None
+    ) -> None:
+        self.dzr = dzr
+        self.library = library
+        self.max_jobs = max_jobs
+
+        self.ids = itertools.count(1)
+        self.jobs: OrderedDict[int, Job] = OrderedDict()
+        # job key -> the job still running for it
+        self.inflight: dict[tuple[str, str], Job] = {}
+        # link -> its download's future, shared by every job waiting on that link
+        self.downloads: dict[str, asyncio.Future] = {}
+        self.searches = ThreadPoolExecutor(max_workers=dzr.max_workers)
+        self.scheduler = DownloadScheduler(
+            download=dzr.download_status,
+            workers=download_workers,
+            retries=retries,
+            on_update=self.__on_download,
+            keep_results=False,
+            verify=verify,
+            bandwidth=bandwidth,
+            throughput=dzr.progress.rate
+        )
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.started = time.time()
+
+    def submit(self, kind: str, query: str, priority: int = INTERACTIVE) -> tuple[Job, bool]:
+        """
+        Starts a job, unless an identical one is still running. Must be called on the event loop.
+
+        Args:
+            kind (str): SEARCH | DOWNLOAD
+            query (str): What to search for, or a Deezer link.
+            priority (int): Defaults to INTERACTIVE. Where its download goes in the queue, lower goes first.
+
+        Returns:
+            Job: The job.
+            bool: If it's a job which was already running.
+        """
+        key = job_key(kind, query)
+        running = self.inflight.get(key)
+        if running is not None:
+            running.requests += 1
+            if priority < running.priority:
+                running.priority = priority
+                if running.link is not None:
+                    self.scheduler.promote(link=running.link, priority=priority)
+            METRICS.inc("daemon_jobs_total", {"type": kind, "deduplicated": "true"})
+            return running, True
+        job = Job(id=next(self.ids), kind=kind, query=query.strip(), priority=priority)
+        self.jobs[job.id] = job
+        self.inflight[key] = job
+        METRICS.inc("daemon_jobs_total", {"type": kind, "deduplicated": "false"})
+        task = asyncio.ensure_future(self.__run(job))
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        self.__forget()
+        return job, False
+
+    async def __run(self, job: Job) -> None:
+        try:
+            if is_link(job.query):
+                job.link = job.query
+            else:
+                job.state = SEARCHING
+                result = await self.loop.run_in_executor(self.searches, self.dzr.search, job.query)
+                if result is None:
+                    job.state, job.error = FAILED, "not found"
+                    return
+                job.link, job.title = result
+            if job.kind == SEARCH:
+                job.state = DONE
+                return
+            if self.library is not None and job.title is not None and self.library.has(name=job.title, album="/album/" in job.link):
+                job.state, job.result = DONE, "already downloaded"
+                return
+            job.state = DOWNLOADING
+            job.result = await self.__download(job.link, priority=job.priority)
+            job.state = DONE if job.result == OK else FAILED
+        except Exception as e:
+            job.state, job.error = FAILED, str(e)
+        finally:
+            job.finished = time.time()
+            job.done.set()
+
+    async def __download(self, link: str, priority: int) -> str:
+        """
+        Queues the link, or joins its download if it's already queued (from another job), moving it up if `priority`
+        is better. Returns OK | TIMEOUT | FAILED.
+        """
+        future = self.downloads.get(link)
+        if future is None:
+            future = self.loop.create_future()
+            self.downloads[link] = future
+            self.scheduler.submit(link, priority=priority)
+        else:
+            self.scheduler.promote(link=link, priority=priority)
+        # shielded, so one waiter going away doesn't cancel the download for the others
+        return await asyncio.shield(future)
+
+    def __on_download(self, link: str, result: str) -> None:
+        # called on a scheduler thread
+        self.loop.call_soon_threadsafe(self.__downloaded, link, result)
+
+    def __downloaded(self, link: str, result: str) -> None:
+        future = self.downloads.pop(link, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+        if result == OK and self.library is not None:
+            # so the next job for the same song is found in the library
+            self.loop.run_in_executor(self.searches, self.library.refresh)
+
+    def __forget(self) -> None:
+        """Drops the oldest finished jobs once there are more than `self.max_jobs`."""
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if not oldest.done.is_set():
+                break
+            self.jobs.popitem(last=False)
+
+    def status(self) -> dict:
+        """The state of the daemon, for `GET /status`."""
+        states = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "uptime": round(time.time() - self.started, 1),
+            "jobs": states,
+            "inflight": len(self.inflight),
+            "queued_downloads": len(self.scheduler.waiting),
+            "running_downloads": self.scheduler.running,
+            "downloads": self.scheduler.counts,
+            "progress": self.dzr.progress.summary(),
+            "limiter": self.dzr.limiter.stats(),
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers one HTTP request (no keep-alive), see the top of this file for the routes."""
+        try:
+            status, body = await self.__route(reader)
+        except (asyncio.IncompleteReadError, ValueError) as e:
+            status, body = 400, {"error": f"bad request: {e}"}
+        if isinstance(body, str):
+            data, content_type = body.encode(), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(body).encode(), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def __route(self, reader: asyncio.StreamReader) -> tuple[int, object]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            raise ValueError("no request line")
+        method, target = request_line[0].upper(), request_line[1]
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        if length > MAX_BODY:
+            return 413, {"error": "body too large"}
+        body = await reader.readexactly(length) if length > 0 else b""
+
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["jobs"] and method == "POST":
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                return 400, {"error": "expected a JSON object"}
+            kind, query = payload.get("type", DOWNLOAD), payload.get("query")
+            priority = payload.get("priority", INTERACTIVE)
+            priority = PRIORITIES.get(priority, priority) if isinstance(priority, str) else priority
+            if kind not in (SEARCH, DOWNLOAD) or not isinstance(query, str) or not query.strip():
+                return 400, {"error": 'expected {"type": "search" | "download", "query": "..."}'}
+            if not isinstance(priority, int) or isinstance(priority, bool):
+                return 400, {"error": 'expected "priority" to be "interactive", "batch" or an int'}
+            job, deduplicated = self.submit(kind, query, priority=priority)
+            return 202, {"job": job.to_dict(), "deduplicated": deduplicated}
+        if parts == ["jobs"] and method == "GET":
+            return 200, {"jobs": [job.to_dict() for job in reversed(self.jobs.values())]}
+        if len(parts) == 2 and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+            if job is None:
+                return 404, {"error": "no such job"}
+            wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(job.done.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+            return 200, {"job": job.to_dict()}
+        if parts == ["status"] and method == "GET":
+            return 200, self.status()
+        if parts == ["metrics"] and method == "GET":
+            return 200, METRICS.prometheus()
+        if parts and parts[0] in ("jobs", "status", "metrics"):
+            return 405, {"error": f"{method} not allowed"}
+        return 404, {"error": "not found"}
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None) -> None:
+        """
+        Starts the downloads and answers requests until cancelled.
+
+        Args:
+            host (str): Defaults to "127.0.0.1". Only local clients by default.
+            port (int): Defaults to 8765.
+            socket_path (str): Optional. Listen on this Unix socket instead of `host` & `port`.
+
+        Returns:
+            None
+        """
+        self.loop = asyncio.get_running_loop()
+        self.scheduler.start()
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.searches.shutdown(wait=False, cancel_futures=True)
@@ -49,14 +49,28 @@ class Design:
         # NAME | ALIAS | DESCRIPTION
         table.add_row("search", "sch", "[Legacy] Search songs from the text file, 'songs.txt'.")
         table.add_row("download", "dl", "[Legacy] Download the songs. Must run 'search' before!")
-        table.add_row("direct", "dr", "[Legacy] Directly download a song/album given the query or URL!")
+        table.add_row("stream", "st", "Search & download the songs from 'songs.txt' at the same time.")
+        table.add_row("direct", "dr", "[Legacy] Directly download a song/album given the query or URL! A playlist/artist URL downloads what is new in it.")
         table.add_row("sort", "srt", "Sort the songs (& albums) by the artists.")
-        table.add_row("ss", "N/A", "A better search to refine your query.")
+        table.add_row("sort plan", "srt plan", "Show where 'sort' would move everything, without moving it.")
+        table.add_row("ss", "N/A", "A better search to refine your query, results update as you type.")
         table.add_section()
         table.add_row("get arl", "N/A", "Returns part of the ARL")
         table.add_row("set arl", "N/A", "Enter a new ARL to set")
         table.add_row("arl info", "N/A", "Get the expiry time of the current ARL.")
         table.add_row("settings", "set | set help", "Fine tine your own experience.")
+        table.add_row("set timeout", "N/A", "Seconds without progress before a download is given up on.")
+        table.add_row("set workers", "N/A", "Amount of songs downloaded at once.")
+        table.add_row("set score", "N/A", "Lowest match score (0 - 100) a search result needs.")
+        table.add_row("set engine", "N/A", "Toggle keeping Deemix running between downloads.")
+        table.add_row("set verify", "N/A", "Toggle checking downloaded files (and retrying the broken ones).")
+        table.add_row("set bandwidth", "N/A", "Cap on the MB/s all downloads use together (0 for none).")
+        table.add_row("journal", "N/A", "How many songs have been searched/downloaded so far.")
+        table.add_row("journal reset", "N/A", "Forget the progress, so everything is searched & downloaded again.")
+        table.add_row("clear cache", "N/A", "Forget the cached search results.")
+        table.add_row("stats", "N/A", "Search & download counters and latencies since starting.")
+        table.add_row("stats export", "N/A", "Write the stats to config/metrics.prom & config/metrics.json.")
+        table.add_row("profile <command>", "N/A", "Profile sch, dl, st, ss or srt into config/profiles/ (add 'cprofile' and/or 'memory' for more).")
         table.add_section()
         table.add_row("[red]clean", "[red]purge", "[red]!! Removes EVERYTHING in your download location. !!")
         table.add_row("[yellow]quit", "[yellow]exit | q", "[yellow]Quits the application!")
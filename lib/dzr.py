@@ -1,12 +1,48 @@
 import os
 import re
+import time
+import threading
 
 from datetime import datetime
-from typing import Union, Optional
-from subprocess import PIPE, Popen, TimeoutExpired
+from typing import Callable, NamedTuple, Union, Optional
+from subprocess import DEVNULL, PIPE, STDOUT, Popen, TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from lib.cache import SearchCache, normalize_query
+from lib.ratelimit import RateLimiter
+from lib.match import best_matches, label
+from lib.engine import DeemixEngine
+from lib.watchdog import Watchdog
+from lib.progress import ProgressTracker, parse_line
+from lib.metrics import METRICS, SIZE_BUCKETS
+from lib.scheduler import OK, TIMEOUT, FAILED
+from lib.singleflight import SingleFlight
+
+# songs.txt lines which are an ID instead of words, see `Dzr.lookup()`
+DIRECT_QUERY = re.compile(r"^(isrc|track|album):\s*([A-Za-z0-9]+)$", re.IGNORECASE)
+# playlist & artist links, which are expanded into their tracks (or albums), see `Dzr.expand()`
+COLLECTION_LINK = re.compile(r"deezer\.com/(?:[a-z]{2}(?:-[a-z]{2})?/)?(playlist|artist)/(\d+)", re.IGNORECASE)
+# known tracks of a playlist fetched again to tell if tracks were only added on the end
+PLAYLIST_OVERLAP = 10
+# seconds to connect & between bytes of a response, unless a request passes its own, so a stalled connection is retried
+REQUEST_TIMEOUT = 15
+
+
+class Account(NamedTuple):
+    """What `Dzr.account()` found out about the account behind the ARL."""
+    valid: bool
+    firstname: str = "N/A"
+    lastname: str = "N/A"
+    email: str = "N/A"
+    country: str = "N/A"
+    plan: str = "N/A"
+    date_start: str = "0000-00-00"
+    date_end: str = "0000-00-00"
+    is_lossless: bool = False
+
 
 class Dzr:
     """
@@ -19,19 +55,57 @@ class Dzr:
         self,
         bitrate: str = "FLAC",
         music_dir: str = "./music/",
-        timeout: int = 30
+        timeout: int = 30,
+        max_workers: int = 8,
+        cache: Optional[SearchCache] = None,
+        min_score: float = 60
     ) -> None:
         self.session = requests.Session()
+        # the session is shared between the `search_many` threads, so keep enough pooled connections for all of them
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(10, max_workers)))
+        # every request to Deezer goes through `self.request()` and so this limiter
+        self.limiter = RateLimiter()
+        self.max_retries = 5
+        self.max_workers = max_workers
+        # best matches scoring below this (0 - 100) count as not found
+        self.min_score = min_score
         self.bitrate = bitrate
         self.music_dir = music_dir
+        # seconds a download can go without making progress
         self.timeout = timeout
+        # seconds each track adds to a download's hard cap, see `self.hard_cap()`
+        self.seconds_per_track = 120
+        self.poll_interval = 0.5
+        # items per request when listing a playlist's tracks or an artist's albums
+        self.page_size = 100
+        # shared by `search`, `search_many` & `search_query` (and so `Main.direct_download`)
+        self.cache = cache if cache is not None else SearchCache()
+        # identical searches (and downloads of the same link) running at the same time are only done once
+        self.search_flights = SingleFlight("search")
+        self.download_flights = SingleFlight("download")
 
         self.search_url = "https://api.deezer.com/search?q={}&output=json&output=json&version=js-v1.0.0"
         self.album_url = "https://www.deezer.com/en/album/{}"
+        self.track_url = "https://www.deezer.com/track/{}"
+        self.isrc_url = "https://api.deezer.com/track/isrc:{}"
+        self.api_url = "https://api.deezer.com/{}"
+
+        # warm Deemix workers, see `self.start_engine()`. when None, every download starts its own `deemix` process
+        self.engine = None
+        self.engine_error = None
+        # live progress of every running download, fed from Deemix's output
+        self.progress = ProgressTracker()
+        # the output is read (see `self.progress`), so there's no "> NUL" on the end anymore
+        self.download_query = "deemix --portable {} --path " + self.music_dir + " --bitrate " + self.bitrate
 
-        self.download_query = "deemix --portable {} --path " + self.music_dir + " --bitrate " + self.bitrate + " > NUL "
+        # `self.account()` is kept for this many seconds, or until `self.forget_account()`
+        self.account_ttl = 600
+        self.__account = None
+        self.__account_checked = 0.0
+        self.__arl = None
+        self.__account_lock = threading.Lock()
 
-        # arl account specific for ease of access to each property
+        # arl account specific for ease of access to each property (set by `self.account_info()`)
         self.date_start = None
         self.date_end = None
         self.is_lossless = False
@@ -57,40 +131,334 @@ class Dzr:
 
     def search(self, query: str) -> tuple[str]:
         """
-        Searches the Deezer API using the provided query and returns the first link found.
+        Searches the Deezer API using the provided query and returns the best matching link found.
 
         Args:
             query (str): The search query in the format "%track% %artist% (optional "album" to signify to download album)".
 
         Returns:
-            str: The Deezer link of the first search result.
-            str: The title of the song/album to show which song/album is being downloaded.
+            str: The Deezer link of the best matching search result.
+            str: The "%artist% - %title%" of the song/album to show which song/album is being downloaded.
+            OR
+            None: If nothing was found, or nothing scored above `self.min_score`.
+
+        Raises:
+            Exception: If the request to the Deezer API fails.
+        """
+        with METRICS.timer("dzr_search_seconds", {"result": "error"}) as labels:
+            try:
+                if self.is_direct(query):
+                    result = self.lookup(query)
+                else:
+                    album = "album" in query
+                    data = self.__fetch(query=query, album=album)
+                    result = self.__pick(data=data, album=album, match=best_matches([query], [data], [album], self.min_score)[0])
+                labels["result"] = "not_found" if result is None else "found"
+            finally:
+                # "error" if it raised, like `self.search_many()` counts it
+                METRICS.inc("dzr_search_total", labels)
+        return result
+
+    def is_direct(self, query: str) -> bool:
+        """If the query is an ID rather than words, e.g. "isrc:USUM71703861", "track:12345" or "album:678"."""
+        return DIRECT_QUERY.match(query.strip()) is not None
+
+    def lookup(self, query: str) -> Optional[tuple[str]]:
+        """
+        Resolves an ID query straight to its link, without searching or ranking.
+        Track & album IDs don't need a request at all, an ISRC needs one (cached like the searches).
+
+        Args:
+            query (str): "isrc:%isrc%" | "track:%id%" | "album:%id%"
+
+        Returns:
+            str: The Deezer link.
+            str: The "%artist% - %title%" of the track for an ISRC, otherwise the query itself.
+            OR
+            None: If the query isn't an ID, or the ISRC isn't on Deezer.
 
         Raises:
             Exception: If the request to the Deezer API fails.
         """
-        if "album" in query:
-            album = True
+        match = DIRECT_QUERY.match(query.strip())
+        if match is None:
+            return None
+        kind, value = match.group(1).lower(), match.group(2)
+        if kind == "track":
+            return (self.track_url.format(value), query.strip())
+        if kind == "album":
+            return (self.album_url.format(value), query.strip())
+
+        key = f"isrc:{value.upper()}"
+        data = self.cache.get(query=key, album=False)
+        if data is None:
+            r = self.request("GET", url=self.isrc_url.format(value.upper()))
+            if not r.status_code == 200:
+                raise Exception(f"Failed to make a request: {r.status_code}")
+            track = r.json()
+            # an unknown ISRC is a 200 with {"error": {...}}
+            data = [track] if "error" not in track else []
+            self.cache.set(query=key, album=False, data=data)
+        if len(data) == 0:
+            return None
+        try:
+            return (data[0]["link"], label(data[0]))
+        except KeyError:
+            return None
+
+    def is_collection(self, link: str) -> bool:
+        """If the link is a playlist or an artist, see `self.expand()`."""
+        return COLLECTION_LINK.search(link) is not None
+
+    def expand(self, link: str) -> list[tuple[str, str]]:
+        """
+        Lists what's behind a playlist link (its tracks) or an artist link (their albums), fetching the pages at once.
+        A playlist's tracks are cached with its checksum: if it didn't change that's a single request, and if tracks were
+        only added on the end just the pages from the last known track on are fetched.
+
+        Args:
+            link (str): The playlist or artist link.
+
+        Returns:
+            list[tuple[str, str]]: The (link, "%artist% - %title%") of each track or album, in order and without repeats.
+            Empty if the link isn't a playlist or an artist.
+
+        Raises:
+            Exception: If a request to the Deezer API fails, or the playlist/artist doesn't exist.
+        """
+        match = COLLECTION_LINK.search(link)
+        if match is None:
+            return []
+        kind, id = match.group(1).lower(), match.group(2)
+        r = self.request("GET", url=self.api_url.format(f"{kind}/{id}"))
+        info = r.json() if r.status_code == 200 else {"error": r.status_code}
+        if "error" in info:
+            METRICS.inc("dzr_api_errors_total", {"stage": "expand"})
+            raise Exception(f"Could not get {kind} {id}: {info['error']}")
+
+        if kind == "playlist":
+            data = self.__playlist(id=id, checksum=info.get("checksum"), total=info.get("nb_tracks", 0))
         else:
-            album = False
-        r = self.session.get(
+            METRICS.inc("dzr_expand_total", {"kind": kind, "cache": "miss"})
+            albums = self.__pages(path=f"artist/{id}/albums", total=info.get("nb_album", 0))
+            data = [
+                {"link": self.album_url.format(album["id"]), "title": f"{info.get('name')} - {album['title']}"}
+                for album in albums if "id" in album
+            ]
+        unique = {item["link"]: item["title"] for item in data}
+        return list(unique.items())
+
+    def __playlist(self, id: str, checksum: Optional[str], total: int) -> list[dict]:
+        """The {"link", "title"} of each track of a playlist, see `self.expand()`."""
+        key = f"playlist:{id}"
+        cached = self.cache.get(query=key, album=False)
+        known = cached[0] if cached else None
+        if known is not None and checksum is not None and known["checksum"] == checksum:
+            METRICS.inc("dzr_expand_total", {"kind": "playlist", "cache": "hit"})
+            return known["tracks"]
+
+        def listing(tracks: list[dict]) -> list[dict]:
+            return [{"link": track["link"], "title": label(track)} for track in tracks if "link" in track]
+
+        data = None
+        if known is not None and total >= len(known["tracks"]) > 0:
+            # the last few known tracks are fetched again: if they're still where they were, only the end changed
+            old = known["tracks"]
+            start = max(0, len(old) - PLAYLIST_OVERLAP)
+            tail = listing(self.__pages(path=f"playlist/{id}/tracks", total=total, start=start))
+            if [track["link"] for track in tail[:len(old) - start]] == [track["link"] for track in old[start:]]:
+                METRICS.inc("dzr_expand_total", {"kind": "playlist", "cache": "append"})
+                data = old[:start] + tail
+        if data is None:
+            METRICS.inc("dzr_expand_total", {"kind": "playlist", "cache": "miss"})
+            data = listing(self.__pages(path=f"playlist/{id}/tracks", total=total))
+        if checksum is not None:
+            self.cache.set(query=key, album=False, data=[{"checksum": checksum, "tracks": data}])
+        return data
+
+    def __pages(self, path: str, total: int, start: int = 0) -> list[dict]:
+        """Every item of a paginated API list from `start` on, `self.page_size` a request with the requests running at once."""
+        def page(index: int) -> list[dict]:
+            r = self.request("GET", url=self.api_url.format(f"{path}?index={index}&limit={self.page_size}"))
+            if not r.status_code == 200:
+                METRICS.inc("dzr_api_errors_total", {"stage": "expand"})
+                raise Exception(f"Failed to make a request: {r.status_code}")
+            return r.json().get("data", [])
+
+        indexes = list(range(start, max(total, start + 1), self.page_size))
+        with ThreadPoolExecutor(max_workers=min(len(indexes), self.max_workers)) as executor:
+            pages = list(executor.map(page, indexes))
+        return [item for items in pages for item in items]
+
+    def __pick(self, data: list[dict], album: bool, match: Optional[tuple[int, float]]) -> Optional[tuple[str]]:
+        """Turns the best match out of `lib.match.best_matches` into the (link, title) returned by `self.search()`."""
+        if match is None:
+            return None
+        result = data[match[0]]
+        try:
+            if album:
+                # when album specified, download all of the album instead of the individiual song
+                return (
+                    self.album_url.format(result["album"]["id"]),
+                    label(result, album=True),
+                )
+            return (
+                result["link"],
+                label(result)
+            )
+        except KeyError:
+            return None
+
+    def __fetch(self, query: str, album: bool) -> list[dict]:
+        """
+        Returns the "data" of the search for the query, from the cache if it's there, otherwise from the Deezer API.
+
+        Args:
+            query (str): The search query.
+            album (bool): If the query is for an album. Part of the cache key.
+
+        Returns:
+            list[dict]: The search results, empty if nothing was found.
+
+        Raises:
+            Exception: If the request to the Deezer API fails.
+        """
+        data = self.cache.get(query=query, album=album)
+        if data is not None:
+            METRICS.inc("dzr_search_cache_total", {"cache": "hit"})
+            return data
+        METRICS.inc("dzr_search_cache_total", {"cache": "miss"})
+        # the same key as the cache, so "x ft. y" waits for a running "X (feat. Y)" instead of asking again
+        return self.search_flights.do(
+            (normalize_query(query), album),
+            lambda: self.__fetch_remote(query=query, album=album)
+        )
+
+    def __fetch_remote(self, query: str, album: bool) -> list[dict]:
+        """The part of `self.__fetch()` which asks the Deezer API, caching what it gets."""
+        r = self.request(
+            "GET",
             url=self.search_url.format(query.replace("album", "").replace(" ", "%20"))
         )
-        if r.status_code == 200:
+        if not r.status_code == 200:
+            METRICS.inc("dzr_api_errors_total", {"stage": "search"})
+            raise Exception(f"Failed to make a request: {r.status_code}")
+        data = r.json().get("data", [])
+        self.cache.set(query=query, album=album, data=data)
+        return data
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Makes a request through `self.session`, going through `self.limiter` first and backing off
+        (then trying again) while Deezer throttles us or has a hiccup.
+
+        Args:
+            method (str): "GET" | "POST"
+            url (str): The URL to request.
+            **kwargs: Passed on to `requests.Session.request`. "timeout" defaults to `REQUEST_TIMEOUT`.
+
+        Returns:
+            requests.Response: The response, which is the last one received if every retry was throttled too.
+
+        Raises:
+            requests.RequestException: If the request couldn't be made at all, even after retrying.
+        """
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        attempt = 0
+        while True:
+            self.limiter.acquire()
             try:
-                if album:
-                    # when album specified, download all of the album instead of the individiual song
-                    return (
-                        self.album_url.format(r.json()["data"][0]["album"]["id"]),
-                        r.json()["data"][0]["album"]["title"],
-                    )
-                return (
-                    r.json()["data"][0]["link"],
-                    r.json()["data"][0]["title"]
-                ) # TODO: Find best match for query -> songname
-            except (IndexError, KeyError):
-                return None
-        raise Exception(f"Failed to make a request: {r.status_code}")
+                with METRICS.timer("dzr_http_seconds", {"method": method}) as labels:
+                    labels["status"] = "error"
+                    r = self.session.request(method, url, **kwargs)
+                    labels["status"] = str(r.status_code)
+            except requests.RequestException:
+                METRICS.inc("dzr_http_requests_total", labels)
+                if attempt >= self.max_retries:
+                    self.limiter.error()
+                    raise
+                # a network glitch, not Deezer telling us to slow down
+                time.sleep(self.limiter.retry(attempt))
+                attempt += 1
+                continue
+            METRICS.inc("dzr_http_requests_total", labels)
+            if not self.__is_throttled(r):
+                self.limiter.success()
+                return r
+            METRICS.inc("dzr_http_throttled_total", {"method": method})
+            if attempt >= self.max_retries:
+                self.limiter.error()
+                return r
+            time.sleep(self.limiter.throttled(attempt))
+            attempt += 1
+
+    def __is_throttled(self, r: requests.Response) -> bool:
+        """If Deezer turned the request down for going too fast (or was briefly unavailable)."""
+        if r.status_code == 429 or r.status_code >= 500:
+            return True
+        # the public API answers 200 with {"error": {"code": 4, "message": "Quota limit exceeded"}} instead of a 429
+        if r.status_code == 200 and b'"error"' in r.content[:64]:
+            try:
+                return r.json()["error"].get("code") == 4
+            except (ValueError, KeyError, AttributeError):
+                return False
+        return False
+
+    def search_many(
+        self,
+        queries: list[str],
+        max_workers: Optional[int] = None,
+        on_result: Optional[Callable[[str, Optional[tuple[str]]], None]] = None
+    ) -> list[Optional[tuple[str]]]:
+        """
+        Runs `self.search()` for many queries at once over the shared session, ranking each result as soon as it's in.
+
+        Args:
+            queries (list[str]): The search queries, same format as `self.search()`.
+            max_workers (int): Defaults to `self.max_workers`. Amount of requests in flight at once.
+            on_result (Callable): Optional. Called with (query, result) as each result comes in, in input order.
+
+        Returns:
+            list[Optional[tuple[str]]]: The results of `self.search()`, in the same order as `queries`.
+            A query whose request still fails after `self.request()` retried it is None, instead of stopping the whole batch.
+        """
+        results = []
+        if len(queries) == 0:
+            return results
+        album = ["album" in query for query in queries]
+        direct = [self.is_direct(query) for query in queries]
+        # indexes of the queries whose request failed, already counted as errors
+        errored = set()
+
+        def fetch(index: int, query: str, is_album: bool, is_direct: bool) -> Union[list[dict], tuple[str], None]:
+            try:
+                if is_direct:
+                    # the link itself, nothing to rank
+                    return self.lookup(query)
+                return self.__fetch(query=query, album=is_album)
+            except Exception:
+                # already counted in `self.limiter`'s errors
+                METRICS.inc("dzr_search_total", {"result": "error"})
+                errored.add(index)
+                return None if is_direct else []
+
+        def rank(index: int, data: Union[list[dict], tuple[str], None]) -> None:
+            if direct[index]:
+                result = data
+            else:
+                match = best_matches([queries[index]], [data], [album[index]], self.min_score)[0]
+                result = self.__pick(data=data, album=album[index], match=match)
+            if index not in errored:
+                METRICS.inc("dzr_search_total", {"result": "not_found" if result is None else "found"})
+            if on_result is not None:
+                on_result(queries[index], result)
+            results.append(result)
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            # `map` yields in input order, so the results line up with the queries
+            for index, data in enumerate(executor.map(fetch, range(len(queries)), queries, album, direct)):
+                rank(index, data)
+        return results
     
     def search_query(self, query: str) -> list[str]:
         """
@@ -108,14 +476,13 @@ class Dzr:
 
         High likelyhood that the song IS within the top 10 results. So only return 10.
         """
-        r = self.session.get(
-            url=self.search_url.format(query.replace("album", "").replace(" ", "%20"))
-        )
-        if not r.status_code == 200:
-            raise Exception(f"Failed to make a request: {r.status_code}")
+        with METRICS.timer("dzr_search_query_seconds", {"result": "error"}) as labels:
+            data = self.__fetch(query=query, album="album" in query)
+            labels["result"] = "found" if data else "not_found"
+        METRICS.inc("dzr_search_query_total", labels)
         
         # slice the list and only show the 10 results
-        result = r.json()["data"][0:10]
+        result = data[0:10]
         
         return result
             
@@ -127,38 +494,236 @@ class Dzr:
             song_link (str): The given track link returned from `self.search()`.
         
         Returns:
-            bool: If process.wait is found, reached then True | False
+            bool: If Deemix finished successfully within `self.timeout` then True | False
         """
-        
-        # TODO: refactor this into subprocess.run and check if "Paste here your arl" is in the output,
-        # TODO: if so, then raise Exception OR return None. then in `download` calls, then handle for exceptions
-        
-        process = Popen(self.download_query.format(song_link).split(), stdout=PIPE, stdin=PIPE)
+        return self.download_status(song_link=song_link) == OK
+
+    def download_status(self, song_link: str) -> str:
+        """
+        Downloads the song by the link using Deemix, telling apart the ways it can go wrong.
+        If the link is already being downloaded (e.g. by another thread), waits for that download instead.
+
+        Deemix is only killed once it makes no progress for `self.timeout` seconds, or once it runs past
+        `self.hard_cap()`, which grows with the amount of tracks behind the link.
+
+        Args:
+            song_link (str): The given track link returned from `self.search()`.
+
+        Returns:
+            str: OK if Deemix exited cleanly, TIMEOUT if it was stuck (or ran past its hard cap), otherwise FAILED.
+        """
+        return self.download_flights.do(song_link, lambda: self.__download_status(song_link))
+
+    def __download_status(self, song_link: str) -> str:
+        started = time.monotonic()
+        watchdog = Watchdog(stall=self.timeout, hard_cap=self.hard_cap(song_link))
+        result = FAILED
         try:
-            process.wait(self.timeout)
-            return True
-        except TimeoutExpired:
-            process.kill()
+            if self.engine is not None:
+                engine_result = self.engine.download(
+                    link=song_link,
+                    watchdog=watchdog,
+                    on_line=lambda line: self.__on_output(link=song_link, line=line)
+                )
+                if engine_result is not None:
+                    result = engine_result
+                    return result
+                # no workers left alive, so fall back to a process for this link
+            result = self.__download_process(song_link=song_link, watchdog=watchdog)
+            return result
+        finally:
+            downloaded = self.progress.done(link=song_link)
+            labels = {"result": result}
+            METRICS.inc("dzr_download_total", labels)
+            METRICS.observe("dzr_download_seconds", time.monotonic() - started, labels)
+            if result == OK:
+                METRICS.observe("dzr_download_bytes", downloaded, buckets=SIZE_BUCKETS)
+
+    def __download_process(self, song_link: str, watchdog: Watchdog) -> str:
+        """
+        Downloads the link with a `deemix` process of its own, reading its output as it goes. Only its own output
+        ("Download at x%" as the bytes come in) counts as progress, since the music folder is shared with the other downloads.
+        """
+        # no stdin, so Deemix exits instead of waiting forever on "Paste here your arl" when the ARL is invalid
+        process = Popen(
+            self.download_query.format(song_link).split(),
+            stdout=PIPE,
+            stderr=STDOUT,
+            stdin=DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace"
+        )
+
+        def read() -> None:
+            # drained on its own thread, so the pipe never fills up and stalls Deemix
+            for line in process.stdout:
+                watchdog.progress()
+                self.__on_output(link=song_link, line=line)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        while True:
+            try:
+                returncode = process.wait(self.poll_interval)
+                break
+            except TimeoutExpired:
+                pass
+            if watchdog.expired() is not None:
+                process.kill()
+                process.wait()
+                reader.join(timeout=1)
+                return TIMEOUT
+        reader.join(timeout=1)
+        if returncode != 0 or len(self.progress.errors(link=song_link)) > 0:
+            return FAILED
+        return OK
+
+    def __on_output(self, link: str, line: str) -> None:
+        """Feeds one line of Deemix's output for the link into `self.progress`."""
+        for event in parse_line(line):
+            self.progress.feed(link=link, event=event)
+
+    def hard_cap(self, song_link: str) -> float:
+        """
+        The longest a download of the link may take, however much progress it's making:
+        `self.timeout` plus `self.seconds_per_track` for each of its tracks.
+
+        Args:
+            song_link (str): The Deezer link.
+
+        Returns:
+            float: Seconds.
+        """
+        return self.timeout + self.seconds_per_track * self.track_count(song_link)
+
+    def track_count(self, song_link: str) -> int:
+        """
+        The amount of tracks behind a link: 1 for a track, otherwise looked up (and cached) for an album or playlist.
+
+        Args:
+            song_link (str): The Deezer link.
+
+        Returns:
+            int: The amount of tracks, or a guess of 25 if it couldn't be looked up.
+        """
+        match = re.search(r"/(album|playlist)/(\d+)", song_link)
+        if match is None:
+            return 1 if "/track/" in song_link else 25
+        key = f"{match.group(1)}:{match.group(2)}:tracks"
+        data = self.cache.get(query=key, album=False)
+        if data is None:
+            try:
+                r = self.request("GET", url=self.api_url.format(f"{match.group(1)}/{match.group(2)}"))
+                data = [{"nb_tracks": r.json()["nb_tracks"]}] if r.status_code == 200 else []
+            except (requests.RequestException, ValueError, KeyError):
+                data = []
+            self.cache.set(query=key, album=False, data=data)
+        return data[0]["nb_tracks"] if len(data) > 0 else 25
+
+    def durations(self, song_link: str) -> dict[str, int]:
+        """
+        The duration Deezer gives for each track behind a link, looked up (and cached) like `self.track_count()`.
+
+        Args:
+            song_link (str): The Deezer link.
+
+        Returns:
+            dict[str, int]: The track title (as Deezer has it) -> seconds, empty if it couldn't be looked up.
+        """
+        match = re.search(r"/(track|album|playlist)/(\d+)", song_link)
+        if match is None:
+            return {}
+        kind, id = match.groups()
+        key = f"{kind}:{id}:durations"
+        data = self.cache.get(query=key, album=False)
+        if data is None:
+            try:
+                r = self.request("GET", url=self.api_url.format(f"{kind}/{id}"))
+                body = r.json() if r.status_code == 200 else {}
+                tracks = [body] if kind == "track" else body.get("tracks", {}).get("data", [])
+                data = [{"title": track["title"], "duration": track["duration"]} for track in tracks if "duration" in track]
+            except (requests.RequestException, ValueError, KeyError, AttributeError):
+                data = []
+            self.cache.set(query=key, album=False, data=data)
+        return {track["title"]: track["duration"] for track in data}
+
+    def start_engine(self, workers: int = 4) -> bool:
+        """
+        Starts warm Deemix workers, so downloads don't pay for Deemix starting up and logging in every time.
+
+        Args:
+            workers (int): Defaults to 4. Amount of worker processes.
+
+        Returns:
+            bool: If the workers are up. If not, downloads keep using a `deemix` process each and `self.engine` stays None.
+        """
+        self.stop_engine()
+        engine = DeemixEngine(music_dir=self.music_dir, bitrate=self.bitrate, workers=workers)
+        if not engine.start():
+            self.engine_error = engine.error
+            engine.close()
             return False
+        self.engine = engine
+        return True
 
-    def account_info(self, check_only: bool = False) -> Union[str, None, bool]:
+    def stop_engine(self) -> None:
+        """Stops the Deemix workers, if they were started."""
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def warm_up(self) -> None:
+        """
+        Opens a connection to the Deezer API (kept in `self.session`'s pool), so the first search doesn't pay for the TLS handshake.
+
+        Raises:
+            requests.RequestException: If Deezer can't be reached.
         """
-        Using the ARL, returns the account information available.
+        self.request("GET", url=self.api_url.format("infos"), timeout=10)
+
+    def arl(self) -> str:
+        """The ARL in config/.arl, only read from disk once (until `self.forget_account()`)."""
+        if self.__arl is None:
+            with open("config/.arl") as f:
+                self.__arl = f.read().strip()
+        return self.__arl
+
+    def account(self, refresh: bool = False) -> Account:
+        """
+        The account behind the ARL. Only asked for once every `self.account_ttl` seconds, so checking it is cheap.
 
         Args:
-            check_only (bool): Defaults to False. Used for checking only if the ARL is valid.
-        
+            refresh (bool): Defaults to False. If True, ask Deezer again even if it's cached.
+
         Returns:
-            None: Properties assorted correctly
-            OR
-            str: If ARL is invalid, which it will return "Invalid"
-            OR
-            bool: if check_only is True
+            Account: The account, `valid` is False if Deezer turned the ARL down.
+
+        Raises:
+            OSError: If config/.arl can't be read.
+            requests.RequestException: If Deezer can't be reached.
         """
-        with open("config/.arl") as f:
-            cookies = {
-                "arl": f.read().strip()
-            }
+        # held while asking, so several threads checking at once only ask once
+        with self.__account_lock:
+            if not refresh and self.__account is not None and time.monotonic() - self.__account_checked < self.account_ttl:
+                METRICS.inc("dzr_account_cache_total", {"cache": "hit"})
+                return self.__account
+            METRICS.inc("dzr_account_cache_total", {"cache": "miss"})
+            self.__account = self.__fetch_account()
+            self.__account_checked = time.monotonic()
+            return self.__account
+
+    def forget_account(self) -> None:
+        """Forgets the cached ARL & account, e.g. after config/.arl was changed."""
+        with self.__account_lock:
+            self.__account = None
+            self.__arl = None
+
+    def __fetch_account(self) -> Account:
+        """Asks Deezer about the account, parsing the response once."""
+        cookies = {
+            "arl": self.arl()
+        }
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:130.0) Gecko/20100101 Firefox/130.0',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/jxl,image/webp,image/png,image/svg+xml,*/*;q=0.8',
@@ -166,46 +731,66 @@ class Dzr:
             'Accept-Encoding': 'gzip, deflate, br, zstd',
             "Content-Type": "type/plain;charset=UTF-8"
         }
-        r = self.session.post(
-            url="https://www.deezer.com/ajax/gw-light.php?method=deezer.getUserData&input=3&api_version=1.0&api_token=&cid=361312840",
-            headers=headers,
-            cookies=cookies
-        )
-        if r.status_code == 200:
-            if check_only:
-                return r.status_code == 200
-            
-            # assorting the account information into variables (easier)
-            try:
-                # dates
-                self.date_start = self.__strip_date(date=r.json()["results"]["USER"]["TRY_AND_BUY"]["DATE_START"])
-                self.date_end = self.__strip_date(date=r.json()["results"]["USER"]["TRY_AND_BUY"]["DATE_END"])
+        with METRICS.timer("dzr_account_info_seconds"):
+            r = self.request(
+                "POST",
+                url="https://www.deezer.com/ajax/gw-light.php?method=deezer.getUserData&input=3&api_version=1.0&api_token=&cid=361312840",
+                headers=headers,
+                cookies=cookies
+            )
+        METRICS.inc("dzr_account_info_total", {"result": "valid" if r.status_code == 200 else "invalid"})
+        if r.status_code != 200:
+            METRICS.inc("dzr_api_errors_total", {"stage": "account_info"})
+            return Account(valid=False)
+        try:
+            results = r.json()["results"]
+            user = results["USER"]
+            return Account(
+                valid=True,
+                firstname=user["FIRSTNAME"],
+                lastname=user["LASTNAME"],
+                email=user["EMAIL"],
+                country=results["COUNTRY"],
+                plan=results["OFFER_NAME"],
+                date_start=self.__strip_date(date=user["TRY_AND_BUY"]["DATE_START"]),
+                date_end=self.__strip_date(date=user["TRY_AND_BUY"]["DATE_END"]),
+                # is music x or y?
+                is_lossless=bool(user["OPTIONS"]["web_lossless"]),
+            )
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # e.g. no trial dates on the account
+            return Account(valid=True)
 
-                self.plan = r.json()["results"]["OFFER_NAME"]
+    def account_info(self, check_only: bool = False) -> Union[str, None, bool]:
+        """
+        Using the ARL, returns the account information available. Goes through `self.account()`, so it's cached.
 
-                # is music x or y?
-                self.is_lossless = r.json()["results"]["USER"]["OPTIONS"]["web_lossless"]
-                
-                # personal information
-                self.firstname = r.json()["results"]["USER"]["FIRSTNAME"]
-                self.lastname = r.json()["results"]["USER"]["LASTNAME"]
-                self.email = r.json()["results"]["USER"]["EMAIL"]
-                self.country = r.json()["results"]["COUNTRY"]
-            except KeyError:
-                self.date_start = "0000-00-00"
-                self.date_end = "0000-00-00"
-
-                self.is_lossless = "N/A"
-                self.plan = "N/A"
-                
-                # personal information
-                self.firstname = "N/A"
-                self.lastname = "N/A"
-                self.email = "N/A"
-                self.country = "N/A"
+        Args:
+            check_only (bool): Defaults to False. Used for checking only if the ARL is valid.
+        
+        Returns:
+            None: Properties assorted correctly
+            OR
+            str: If ARL is invalid, which it will return "Invalid"
+            OR
+            bool: if check_only is True
+        """
+        account = self.account()
+        if not account.valid:
+            return "Invalid"
+        if check_only:
+            return True
 
-            return None
-        return "Invalid"
+        # assorting the account information into variables (easier)
+        self.date_start = account.date_start
+        self.date_end = account.date_end
+        self.plan = account.plan
+        self.is_lossless = account.is_lossless
+        self.firstname = account.firstname
+        self.lastname = account.lastname
+        self.email = account.email
+        self.country = account.country
+        return None
     
     def __strip_date(self, date: str) -> str:
         new_date = re.match("....-..-..", date).group(0)
@@ -242,6 +827,8 @@ class Scrape:
         if not r.status_code == 200:
             print(r.content.decode())
             return None
+        # only needed here, so starting up doesn't pay for importing bs4 (and lxml)
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(r.content, 'lxml')
         ntable = soup.find_all('table', class_="ntable")
         print(ntable)
@@ -0,0 +1,197 @@
+"""
+engine.py -> Keeps warm Deemix workers (see `lib/worker.py`) and feeds them links, instead of one `deemix` process per link.
+"""
+
+import os
+import sys
+import json
+import queue
+import threading
+
+from typing import Callable, Optional
+from subprocess import DEVNULL, PIPE, Popen
+
+from lib.scheduler import OK, TIMEOUT, FAILED
+from lib.watchdog import Watchdog
+
+
+class _Worker:
+    """One `lib/worker.py` process, with a thread moving its output lines into a queue."""
+    def __init__(self, music_dir: str, bitrate: str) -> None:
+        self.process = Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py"),
+             "--path", music_dir, "--bitrate", bitrate],
+            stdin=PIPE,
+            stdout=PIPE,
+            # keep tracebacks off the rich console
+            stderr=DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1
+        )
+        self.lines = queue.Queue()
+        threading.Thread(target=self.__read, daemon=True).start()
+
+    def __read(self) -> None:
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+        # None marks that the process has gone away
+        self.lines.put(None)
+
+    def send(self, link: str) -> None:
+        self.process.stdin.write(f"{link}\n")
+        self.process.stdin.flush()
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class DeemixEngine:
+    """
+    A pool of Deemix worker processes, each one logged in once and reused for every link.
+
+    Args:
+        music_dir (str): Where the songs are downloaded to.
+        bitrate (str): Defaults to "FLAC". Bitrate to download the songs in.
+        workers (int): Defaults to 4. Amount of worker processes, so the amount of downloads at once.
+        startup_timeout (int): Defaults to 60. Seconds a worker has to import Deemix and log in.
+    """
+    def __init__(
+        self,
+        music_dir: str,
+        bitrate: str = "FLAC",
+        workers: int = 4,
+        startup_timeout: int = 60
+    ) -> None:
+        self.music_dir = music_dir
+        self.bitrate = bitrate
+        self.workers = max(1, workers)
+        self.startup_timeout = startup_timeout
+
+        # workers waiting for a link
+        self.idle = queue.Queue()
+        self.alive = 0
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+
+    def start(self) -> bool:
+        """
+        Starts the workers and waits for them to log in.
+
+        Returns:
+            bool: If at least one worker is ready. If not, `self.error` says why.
+        """
+        starting = [threading.Thread(target=self.__spawn, daemon=True) for _ in range(self.workers - self.alive)]
+        for thread in starting:
+            thread.start()
+        for thread in starting:
+            thread.join()
+        return self.alive > 0
+
+    def __spawn(self) -> bool:
+        """Starts one worker and hands it to `self.idle` once it's logged in."""
+        if self.closed:
+            return False
+        try:
+            worker = _Worker(music_dir=self.music_dir, bitrate=self.bitrate)
+        except OSError as e:
+            self.error = str(e)
+            return False
+        try:
+            line = worker.lines.get(timeout=self.startup_timeout)
+        except queue.Empty:
+            line = "@@error timed out while starting"
+        if line != "@@ready":
+            self.error = "worker exited" if line is None else line.removeprefix("@@error ")
+            worker.kill()
+            return False
+        with self.lock:
+            if self.closed:
+                worker.kill()
+                return False
+            self.alive += 1
+        self.idle.put(worker)
+        return True
+
+    def download(
+        self,
+        link: str,
+        watchdog: Watchdog,
+        on_line: Optional[Callable[[str], None]] = None
+    ) -> Optional[str]:
+        """
+        Downloads the link on the next free worker. Each line Deemix prints counts as progress,
+        and the worker is killed & replaced once the watchdog says it's stuck.
+
+        Args:
+            link (str): The Deezer link.
+            watchdog (Watchdog): Keeps track of the progress of this link.
+            on_line (Callable[[str], None]): Optional. Called with each line Deemix prints for this link.
+
+        Returns:
+            Optional[str]: OK | TIMEOUT | FAILED, or None if there are no workers to run it on.
+        """
+        while True:
+            # checked on every pass, since workers can die (or `close` be called) while waiting
+            if self.alive == 0:
+                return None
+            try:
+                worker = self.idle.get(timeout=1)
+                break
+            except queue.Empty:
+                continue
+        try:
+            worker.send(link)
+        except (BrokenPipeError, OSError):
+            self.__replace(worker)
+            return FAILED
+        # the time spent waiting for a worker (e.g. while one is being replaced) isn't time the link was stuck
+        watchdog.restart()
+
+        while True:
+            try:
+                line = worker.lines.get(timeout=watchdog.remaining())
+            except queue.Empty:
+                if watchdog.expired() is None:
+                    continue
+                self.__replace(worker)
+                return TIMEOUT
+            watchdog.progress()
+            if line is None:
+                self.__replace(worker)
+                return FAILED
+            if line.startswith("@@done "):
+                result = json.loads(line.removeprefix("@@done "))
+                if self.closed:
+                    worker.kill()
+                else:
+                    self.idle.put(worker)
+                return OK if result["status"] == "ok" else FAILED
+            if on_line is not None:
+                on_line(line)
+
+    def __replace(self, worker: _Worker) -> None:
+        """Kills a worker which timed out or died, then starts a new one in the background."""
+        worker.kill()
+        with self.lock:
+            if self.closed:
+                return
+            self.alive -= 1
+        threading.Thread(target=self.__spawn, daemon=True).start()
+
+    def close(self) -> None:
+        """Stops the workers. Busy ones are stopped once their current link is done."""
+        with self.lock:
+            self.closed = True
+            self.alive = 0
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.process.stdin.close()
+            worker.kill()
@@ -0,0 +1,120 @@
+"""
+journal.py -> Remembers what happened to each line of `songs.txt`, so an interrupted run picks up where it stopped.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+from typing import Optional
+
+# the states a line goes through
+PENDING = "pending"
+SEARCHED = "searched"
+DOWNLOADED = "downloaded"
+FAILED = "failed"
+
+
+class Journal:
+    """
+    A SQLite backed record of each line's state: pending, searched (with its link), downloaded or failed (with a reason).
+    Every change is written straight away, so nothing is lost if the process is killed.
+
+    Args:
+        path (str): Defaults to "config/journal.db". Where the journal is stored.
+    """
+    def __init__(self, path: str = "config/journal.db") -> None:
+        self.path = path
+
+        self.lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL keeps the per-line commits cheap
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS lines ("
+            "line TEXT PRIMARY KEY, state TEXT NOT NULL, link TEXT, title TEXT, reason TEXT, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS lines_link ON lines (link)")
+        self.conn.commit()
+
+    def get(self, line: str) -> Optional[tuple[str, Optional[str], Optional[str], Optional[str]]]:
+        """
+        Returns what's known about a line.
+
+        Args:
+            line (str): The line of `songs.txt`.
+
+        Returns:
+            Optional[tuple]: (state, link, title, reason), or None if the line has never been seen.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT state, link, title, reason FROM lines WHERE line = ?", (line,)
+            ).fetchone()
+
+    def pending(self, line: str) -> None:
+        """Records a line as waiting to be searched."""
+        self.__set(line=line, state=PENDING)
+
+    def searched(self, line: str, link: str, title: Optional[str] = None) -> None:
+        """Records the link a line was resolved to."""
+        self.__set(line=line, state=SEARCHED, link=link, title=title)
+
+    def failed(self, line: str, reason: str) -> None:
+        """Records a line which couldn't be searched, e.g. because nothing was found."""
+        self.__set(line=line, state=FAILED, reason=reason)
+
+    def downloaded(self, link: str) -> None:
+        """Records every line resolved to the link as downloaded."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE lines SET state = ?, reason = NULL, updated = ? WHERE link = ?", (DOWNLOADED, time.time(), link)
+            )
+            self.conn.commit()
+
+    def download_failed(self, link: str, reason: str) -> None:
+        """Records every line resolved to the link as failed to download. The link is kept, so it's retried without searching."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE lines SET state = ?, reason = ?, updated = ? WHERE link = ?", (FAILED, reason, time.time(), link)
+            )
+            self.conn.commit()
+
+    def is_downloaded(self, link: str) -> bool:
+        """If any line resolved to the link has been downloaded."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM lines WHERE link = ? AND state = ? LIMIT 1", (link, DOWNLOADED)
+            ).fetchone()
+        return row is not None
+
+    def counts(self) -> dict[str, int]:
+        """Returns the amount of lines in each state."""
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM lines GROUP BY state").fetchall()
+        return {PENDING: 0, SEARCHED: 0, DOWNLOADED: 0, FAILED: 0, **dict(rows)}
+
+    def reset(self) -> None:
+        """Forgets every line, so the next run starts from scratch."""
+        with self.lock:
+            self.conn.execute("DELETE FROM lines")
+            self.conn.commit()
+
+    def __set(
+        self,
+        line: str,
+        state: str,
+        link: Optional[str] = None,
+        title: Optional[str] = None,
+        reason: Optional[str] = None
+    ) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO lines (line, state, link, title, reason, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (line, state, link, title, reason, time.time())
+            )
+            self.conn.commit()
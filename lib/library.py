@@ -0,0 +1,272 @@
+"""
+library.py -> An index of the songs already in the music directory, kept up to date from the file & folder mtimes.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+from typing import Optional
+
+from tinytag import TinyTag
+
+AUDIO_EXTENSIONS = (".flac", ".mp3", ".m4a", ".ogg", ".opus", ".wav")
+
+
+def library_key(artist: Optional[str], title: Optional[str]) -> Optional[str]:
+    """
+    The key a song (or album) is found by, the same shape as the titles `Dzr.search()` returns.
+
+    Args:
+        artist (str): The artist, only the first one is used if there are several.
+        title (str): The track or album title.
+
+    Returns:
+        Optional[str]: "%artist% - %title%" lowercased, or None if either is missing.
+    """
+    if not artist or not title:
+        return None
+    artist = re.split(r"\s*(?:,|;|/|&|\bfeat\.?\s|\bft\.?\s)\s*", artist.strip(), maxsplit=1)[0]
+    return " ".join(f"{artist} - {title}".lower().split())
+
+
+def _isrc(tag: TinyTag) -> Optional[str]:
+    # tinytag 2 keeps the extra fields in `other` (as lists), tinytag 1 in `extra`
+    extra = getattr(tag, "other", None) or getattr(tag, "extra", None) or {}
+    isrc = extra.get("isrc")
+    if isinstance(isrc, list):
+        isrc = isrc[0] if isrc else None
+    return isrc.upper() if isrc else None
+
+
+class LibraryIndex:
+    """
+    A SQLite backed index of every audio file under `music_dir`, with its size, mtime and tags.
+
+    `refresh()` only lists the folders whose mtime changed and only reads tags for files which are new
+    or changed, so keeping it up to date after a download is cheap. Tagged files edited in place inside a
+    folder which otherwise didn't change aren't picked up until that folder changes.
+
+    Args:
+        music_dir (str): The music directory to index.
+        path (str): Defaults to "config/library.db". Where the index is stored.
+    """
+    def __init__(self, music_dir: str, path: str = "config/library.db") -> None:
+        self.music_dir = os.path.abspath(music_dir)
+        self.path = path
+
+        self.lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, folder TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL, "
+            "ext TEXT NOT NULL, artist TEXT, title TEXT, album TEXT, isrc TEXT, track_key TEXT, album_key TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_track_key ON files (track_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_album_key ON files (album_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_isrc ON files (isrc)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, parent TEXT, mtime REAL NOT NULL)"
+        )
+        # the audio hash of each verified download (see `lib/verify.py`), only valid while size & mtime match
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, hash TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS hashes_hash ON hashes (hash)")
+        self.conn.commit()
+
+    def refresh(self) -> list[str]:
+        """
+        Brings the index up to date with what's on disk.
+
+        Returns:
+            list[str]: The paths of the files which are new or changed since the last refresh.
+        """
+        changed = []
+        if not os.path.isdir(self.music_dir):
+            with self.lock:
+                self.conn.execute("DELETE FROM files")
+                self.conn.execute("DELETE FROM folders")
+                self.conn.commit()
+            return changed
+
+        with self.lock:
+            folders = {}
+            children = {}
+            for path, parent, mtime in self.conn.execute("SELECT path, parent, mtime FROM folders"):
+                folders[path] = mtime
+                children.setdefault(parent, []).append(path)
+            seen = set()
+            stack = [self.music_dir]
+            while stack:
+                folder = stack.pop()
+                try:
+                    mtime = os.stat(folder).st_mtime
+                except FileNotFoundError:
+                    continue
+                seen.add(folder)
+                if folders.get(folder) == mtime:
+                    # nothing was added or removed in here, so the known sub folders are still right
+                    stack += children.get(folder, [])
+                    self.__recheck(folder=folder, changed=changed)
+                    continue
+                stack += self.__scan(folder=folder, changed=changed)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO folders (path, parent, mtime) VALUES (?, ?, ?)",
+                    (folder, None if folder == self.music_dir else os.path.dirname(folder), mtime)
+                )
+
+            for folder in set(folders) - seen:
+                self.conn.execute("DELETE FROM folders WHERE path = ?", (folder,))
+                self.conn.execute("DELETE FROM hashes WHERE path IN (SELECT path FROM files WHERE folder = ?)", (folder,))
+                self.conn.execute("DELETE FROM files WHERE folder = ?", (folder,))
+            self.conn.commit()
+        return changed
+
+    def __recheck(self, folder: str, changed: list[str]) -> None:
+        """Re-reads the untagged files of an unchanged folder, since they could have been half written last time. Lock must be held."""
+        rows = self.conn.execute(
+            "SELECT path, size, mtime FROM files WHERE folder = ? AND track_key IS NULL", (folder,)
+        ).fetchall()
+        for path, size, mtime in rows:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self.__index(path=path, folder=folder, stat=stat)
+                changed.append(path)
+
+    def __index(self, path: str, folder: str, stat: os.stat_result) -> None:
+        """Reads the tags of one file into the index. Lock must be held."""
+        try:
+            tag = TinyTag.get(path)
+            artist, title, album, isrc = tag.artist, tag.title, tag.album, _isrc(tag)
+        except Exception:
+            # unreadable (or half written) files are still counted, just without tags
+            artist = title = album = isrc = None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, folder, stat.st_size, stat.st_mtime, os.path.splitext(path)[1].lower().lstrip("."),
+             artist, title, album, isrc, library_key(artist, title), library_key(artist, album))
+        )
+
+    def __scan(self, folder: str, changed: list[str]) -> list[str]:
+        """Re-lists one folder, re-reading the tags of new or changed files. Returns its sub folders. Lock must be held."""
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in self.conn.execute("SELECT path, size, mtime FROM files WHERE folder = ?", (folder,))
+        }
+        sub_folders = []
+        present = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_folders.append(entry.path)
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext not in AUDIO_EXTENSIONS:
+                    continue
+                present.add(entry.path)
+                stat = entry.stat()
+                if known.get(entry.path) == (stat.st_size, stat.st_mtime):
+                    continue
+                self.__index(path=entry.path, folder=folder, stat=stat)
+                changed.append(entry.path)
+        for path in set(known) - present:
+            self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self.conn.execute("DELETE FROM hashes WHERE path = ?", (path,))
+        return sub_folders
+
+    def count(self, ext: Optional[str] = None) -> int:
+        """
+        Returns the amount of indexed songs.
+
+        Args:
+            ext (str): Optional. Only count files with this extension, e.g. "flac".
+
+        Returns:
+            int: The amount of songs.
+        """
+        with self.lock:
+            if ext is None:
+                return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM files WHERE ext = ?", (ext.lower(),)).fetchone()[0]
+
+    def total_size(self) -> int:
+        """Returns the size of every indexed song together, in bytes."""
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def has(self, name: str, album: bool = False) -> bool:
+        """
+        If a song (or album) is already in the library.
+
+        Args:
+            name (str): "%artist% - %title%", as returned by `Dzr.search()`.
+            album (bool): Defaults to False. If True, `name` is "%artist% - %album%" and any of its songs counts.
+
+        Returns:
+            bool: If it's there.
+        """
+        artist, _, title = name.partition(" - ")
+        key = library_key(artist, title)
+        if key is None:
+            return False
+        column = "album_key" if album else "track_key"
+        with self.lock:
+            return self.conn.execute(f"SELECT 1 FROM files WHERE {column} = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def has_isrc(self, isrc: str) -> bool:
+        """If a song with the ISRC is already in the library."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM files WHERE isrc = ? LIMIT 1", (isrc.upper(),)).fetchone() is not None
+
+    def set_hash(self, path: str, digest: str) -> None:
+        """
+        Stores the audio hash of a file, as it is on disk right now.
+
+        Args:
+            path (str): The file.
+            digest (str): Its hash, from `lib.verify.check_file()`.
+
+        Returns:
+            None
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), stat.st_size, stat.st_mtime, digest)
+            )
+            self.conn.commit()
+
+    def find_hash(self, digest: str) -> list[str]:
+        """
+        The files whose audio has the hash, e.g. to find a song downloaded twice under different names.
+
+        Args:
+            digest (str): The hash, from `lib.verify.check_file()`.
+
+        Returns:
+            list[str]: Their paths, left out if they changed since they were hashed.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size, mtime FROM hashes WHERE hash = ?", (digest,)).fetchall()
+        paths = []
+        for path, size, mtime in rows:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if (stat.st_size, stat.st_mtime) == (size, mtime):
+                paths.append(path)
+        return paths
@@ -0,0 +1,63 @@
+"""
+match.py -> Picks the search result that best matches each query, with `rapidfuzz`.
+"""
+
+from typing import Optional
+
+from rapidfuzz import fuzz, process, utils
+
+
+def label(result: dict, album: bool = False) -> str:
+    """
+    The name a search result is matched (and shown) by.
+
+    Args:
+        result (dict): One result of the Deezer search.
+        album (bool): Defaults to False. If True, use the album title instead of the track title.
+
+    Returns:
+        str: "%artist% - %title%"
+    """
+    title = result["album"]["title"] if album else result["title"]
+    return f"{result['artist']['name']} - {title}"
+
+
+def clean_query(query: str) -> str:
+    """Removes the "album" keyword from a query, since it's never a part of the names matched against."""
+    return " ".join(query.replace("album", " ").split())
+
+
+def best_matches(
+    queries: list[str],
+    candidates: list[list[dict]],
+    album: list[bool],
+    threshold: float = 0
+) -> list[Optional[tuple[int, float]]]:
+    """
+    For each query, finds its best matching result out of its own candidates.
+
+    Args:
+        queries (list[str]): The search queries.
+        candidates (list[list[dict]]): The search results of each query, same order as `queries`.
+        album (list[bool]): If each query is for an album, same order as `queries`.
+        threshold (float): Defaults to 0. Best matches scoring below this (0 - 100) are dropped.
+
+    Returns:
+        list[Optional[tuple[int, float]]]: (index into that query's candidates, score), or None if nothing scored high enough.
+    """
+    matches = []
+    for query, results, is_album in zip(queries, candidates, album):
+        if len(results) == 0:
+            matches.append(None)
+            continue
+        # only against its own candidates: scoring a whole batch in one matrix scores every query against
+        # every other query's candidates too, which grows with the square of the batch
+        labels = [label(result, album=is_album) for result in results]
+        _, score, best = process.extractOne(
+            clean_query(query),
+            labels,
+            scorer=fuzz.WRatio,
+            processor=utils.default_process
+        )
+        matches.append((best, float(score)) if score >= threshold else None)
+    return matches
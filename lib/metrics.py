@@ -0,0 +1,178 @@
+"""
+metrics.py -> Counters & latency histograms for the search and download stages, exported as Prometheus text or JSON.
+"""
+
+import json
+import time
+import threading
+
+from typing import Iterator, Optional
+from contextlib import contextmanager
+
+# seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# bytes, for the size of a download
+SIZE_BUCKETS = (1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 500e6, 1e9)
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile as the upper bound of the bucket it falls in."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+def _key(name: str, labels: Optional[dict[str, str]]) -> tuple:
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+def _labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """A thread safe set of counters and histograms, each named and optionally labelled."""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, labels: Optional[dict[str, str]] = None, amount: float = 1) -> None:
+        """Adds `amount` onto a counter."""
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[dict[str, str]] = None,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        """Records a value (e.g. seconds taken) in a histogram."""
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = _Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[dict[str, str]] = None) -> Iterator[dict[str, str]]:
+        """
+        Times the block into the histogram `name`. Yields the labels, so the block can add to them (e.g. a result).
+
+        Args:
+            name (str): The histogram.
+            labels (dict[str, str]): Optional. The labels to start with.
+        """
+        labels = dict(labels or {})
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - started, labels=labels)
+
+    def reset(self) -> None:
+        """Forgets everything recorded."""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: {"counters": [...], "histograms": [...]}, ready to be dumped as JSON.
+        """
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "sum": round(histogram.sum, 6),
+                        "max": round(histogram.max, 6),
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                        "buckets": dict(zip([*map(str, histogram.buckets), "+Inf"], histogram.counts)),
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def prometheus(self) -> str:
+        """Returns everything in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Writes everything to a file: JSON if the path ends in ".json", otherwise the Prometheus text format.
+
+        Args:
+            path (str): Where to write to.
+
+        Returns:
+            None
+        """
+        with open(path, 'w') as f:
+            if path.endswith(".json"):
+                f.write(json.dumps(self.snapshot(), indent=2))
+            else:
+                f.write(self.prometheus())
+
+
+# shared by everything, so `Main` can print and export them all in one place
+METRICS = Metrics()
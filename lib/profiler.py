@@ -0,0 +1,198 @@
+"""
+profiler.py -> Profiles a command (`profile sch` in the menu, `--profile` on the command line): samples the stacks of
+every thread, optionally with `cProfile` on the calling thread and `tracemalloc`, then writes a report and a collapsed-stack
+file (one "frame;frame;frame count" line per stack, what `flamegraph.pl` & speedscope read).
+"""
+
+import os
+import io
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+from typing import Optional
+from datetime import datetime
+
+# where the time of a stack goes, going by the innermost frame from one of these files.
+# the first area whose files a frame is from wins, "idle" only if no other area is in the stack
+AREAS = (
+    ("deemix", ("subprocess.py", "lib/engine.py", "lib/watchdog.py")),
+    ("json", ("json/",)),
+    ("http", ("requests/", "urllib3/", "http/client.py", "ssl.py", "socket.py")),
+    ("rate limit", ("lib/ratelimit.py",)),
+    ("rapidfuzz", ("rapidfuzz/", "lib/match.py")),
+    ("rich", ("rich/",)),
+    ("sqlite", ("lib/cache.py", "lib/journal.py", "lib/library.py")),
+    ("verify", ("lib/verify.py",)),
+    ("sort", ("lib/ss.py", "tinytag/")),
+    ("idle", ("threading.py", "queue.py", "concurrent/futures/", "selectors.py")),
+)
+
+
+def _area(files: list[str]) -> str:
+    """The area of a stack, from its files innermost first."""
+    idle = False
+    for filename in files:
+        filename = filename.replace("\\", "/")
+        for area, parts in AREAS:
+            if any(part in filename for part in parts):
+                if area != "idle":
+                    return area
+                idle = True
+                break
+    return "idle" if idle else "other"
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """
+    Profiles what runs inside of it:
+
+        with Profiler(name="search", memory=True) as profiler:
+            main.search()
+        print(profiler.paths)
+
+    Args:
+        name (str): Goes into the file names, e.g. "search".
+        out_dir (str): Defaults to "config/profiles". Where the files are written.
+        interval (float): Defaults to 0.005. Seconds between samples.
+        deterministic (bool): Defaults to False. If True, `cProfile` the calling thread too (slower, but exact call counts).
+        memory (bool): Defaults to False. If True, trace the allocations with `tracemalloc` and report the biggest.
+    """
+    def __init__(
+        self,
+        name: str,
+        out_dir: str = "config/profiles",
+        interval: float = 0.005,
+        deterministic: bool = False,
+        memory: bool = False
+    ) -> None:
+        self.name = re.sub(r"[^\w.-]+", "_", name).strip("_") or "profile"
+        self.out_dir = out_dir
+        self.interval = interval
+        self.deterministic = deterministic
+        self.memory = memory
+
+        # collapsed stack -> samples
+        self.stacks: dict[str, int] = {}
+        self.areas: dict[str, int] = {}
+        self.samples = 0
+        self.seconds = 0.0
+        self.paths: list[str] = []
+
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.memory_snapshot = None
+
+    def __enter__(self) -> "Profiler":
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.__sample, name="profiler", daemon=True)
+        self.thread.start()
+        if self.deterministic:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.stop.set()
+        self.thread.join()
+        self.seconds = time.perf_counter() - self.started
+        if self.memory and tracemalloc.is_tracing():
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        self.write()
+
+    def __sample(self) -> None:
+        own = threading.get_ident()
+        while not self.stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                files = []
+                while frame is not None:
+                    frames.append(_frame_name(frame.f_code))
+                    files.append(frame.f_code.co_filename)
+                    frame = frame.f_back
+                # "ThreadPoolExecutor-0_3" -> "ThreadPoolExecutor", so the workers add up
+                thread = re.sub(r"(?:[-_]\d+)+$", "", names.get(ident, "thread"))
+                stack = ";".join([thread] + frames[::-1])
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                area = _area(files)
+                self.areas[area] = self.areas.get(area, 0) + 1
+            self.samples += 1
+
+    def report(self, limit: int = 30) -> str:
+        """
+        The report: where the samples went (by area, then by function), then `cProfile` & `tracemalloc` if they ran.
+
+        Args:
+            limit (int): Defaults to 30. Rows of each table.
+
+        Returns:
+            str: The report.
+        """
+        out = io.StringIO()
+        total = sum(self.stacks.values()) or 1
+        out.write(f"{self.name}: {self.seconds:.3f}s, {self.samples} samples every {self.interval * 1000:g}ms over every thread\n\n")
+
+        out.write("Time by area (share of thread samples)\n")
+        for area, count in sorted(self.areas.items(), key=lambda item: item[1], reverse=True):
+            out.write(f"  {count / total * 100:6.1f}%  {area}\n")
+
+        inclusive = {}
+        exclusive = {}
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                exclusive[frames[-1]] = exclusive.get(frames[-1], 0) + count
+            for frame in set(frames):
+                inclusive[frame] = inclusive.get(frame, 0) + count
+        out.write("\nFunctions by samples (total includes what they call)\n")
+        out.write(f"  {'total':>7}  {'self':>7}  function\n")
+        for frame, count in sorted(inclusive.items(), key=lambda item: item[1], reverse=True)[:limit]:
+            out.write(f"  {count / total * 100:6.1f}%  {exclusive.get(frame, 0) / total * 100:6.1f}%  {frame}\n")
+
+        if self.cprofile is not None:
+            out.write("\ncProfile of the calling thread, by cumulative time\n")
+            stats = pstats.Stats(self.cprofile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+
+        if self.memory_snapshot is not None:
+            out.write("\nBiggest allocations still alive at the end (tracemalloc)\n")
+            for stat in self.memory_snapshot.statistics("lineno")[:limit]:
+                out.write(f"  {stat.size / 1024:10.1f} KiB  {stat.count:8d}  {stat.traceback}\n")
+        return out.getvalue()
+
+    def write(self) -> list[str]:
+        """
+        Writes the report (.txt), the collapsed stacks (.folded) and the `cProfile` stats (.prof, for snakeviz & co.).
+
+        Returns:
+            list[str]: The paths written, also kept in `self.paths`.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"{self.name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        with open(f"{base}.txt", 'w', encoding="utf-8") as f:
+            f.write(self.report())
+        with open(f"{base}.folded", 'w', encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        self.paths = [f"{base}.txt", f"{base}.folded"]
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(f"{base}.prof")
+            self.paths.append(f"{base}.prof")
+        return self.paths
@@ -0,0 +1,199 @@
+"""
+progress.py -> Turns Deemix's output into progress events, and adds them up into a throughput & ETA across every running download.
+"""
+
+import re
+import time
+import threading
+
+from typing import NamedTuple, Optional
+from collections import OrderedDict, deque
+
+# the kinds of events
+STARTED = "started"
+PERCENT = "percent"
+BYTES = "bytes"
+FINISHED = "finished"
+ERROR = "error"
+
+# what Deemix prints for a track (see `deemix.utils.formatListener`), which isn't an error
+_INFO_MESSAGES = (
+    "Getting tags.", "Tags got.", "Getting download URL.", "Download URL got.", "Downloading album art.",
+    "Album art downloaded.", "Track downloaded.", "Track already downloaded.", "Tagging track.", "Track tagged.",
+    "Desired bitrate not found", "This track has been searched for",
+)
+
+_DOWNLOADING = re.compile(r"^\[[^\]]+\] (?P<track>.+?) :: Downloading track\. (?:Downloading (?P<bytes>\d+) bytes|Recovering download from (?P<from>\d+))")
+_PERCENT = re.compile(r"^\[[^\]]+\] Download at (?P<percent>[\d.]+)%")
+_COMPLETED = re.compile(r"^\[[^\]]+\] (?:Completed download of (?P<track>.+)|Finished downloading)")
+_TRACK_MESSAGE = re.compile(r"^\[[^\]]+\] (?P<track>.+?) :: (?P<message>.+)$")
+
+# links whose written files are kept for `ProgressTracker.take_files()`, the oldest are dropped past this
+MAX_WRITTEN = 1000
+
+
+class ProgressEvent(NamedTuple):
+    kind: str
+    track: Optional[str] = None
+    percent: Optional[float] = None
+    bytes: Optional[int] = None
+    message: Optional[str] = None
+
+
+def parse_line(line: str) -> list[ProgressEvent]:
+    """
+    Parses one line of Deemix's output.
+
+    Args:
+        line (str): The line, as printed by `deemix` or `lib/worker.py`.
+
+    Returns:
+        list[ProgressEvent]: The events in it, usually none or one.
+    """
+    line = line.strip()
+    if not line or line.startswith("@@"):
+        return []
+    if match := _DOWNLOADING.match(line):
+        if match.group("bytes") is None:
+            return [ProgressEvent(STARTED, track=match.group("track"))]
+        return [
+            ProgressEvent(STARTED, track=match.group("track")),
+            ProgressEvent(BYTES, track=match.group("track"), bytes=int(match.group("bytes"))),
+        ]
+    if match := _PERCENT.match(line):
+        return [ProgressEvent(PERCENT, percent=float(match.group("percent")))]
+    if match := _COMPLETED.match(line):
+        return [ProgressEvent(FINISHED, track=match.group("track"))]
+    if match := _TRACK_MESSAGE.match(line):
+        if match.group("message").startswith(_INFO_MESSAGES):
+            return []
+        return [ProgressEvent(ERROR, track=match.group("track"), message=match.group("message"))]
+    if "Paste here your arl" in line or "Link not recognized" in line or "Link not supported" in line:
+        return [ProgressEvent(ERROR, message=line)]
+    return []
+
+
+class _Job:
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.bytes_total = 0
+        self.percent = 0.0
+        self.track = None
+        self.errors = []
+        self.files = []
+
+    @property
+    def bytes_done(self) -> float:
+        return self.bytes_total * self.percent / 100
+
+
+class ProgressTracker:
+    """Adds up the progress events of every download (by link), for an overall MB/s and ETA."""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # link -> the files its (finished) download wrote
+        self.written: OrderedDict[str, list[str]] = OrderedDict()
+        self.reset()
+
+    def reset(self) -> None:
+        """Starts counting from scratch, e.g. at the start of a batch."""
+        with self.lock:
+            self.started = time.monotonic()
+            self.running = {}
+            self.finished_bytes = 0
+            # (time, bytes done) as of each call to `rate()`
+            self.samples = deque()
+
+    def feed(self, link: str, event: ProgressEvent) -> None:
+        """
+        Adds an event of a download.
+
+        Args:
+            link (str): The link being downloaded.
+            event (ProgressEvent): The event, from `parse_line()`.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            job = self.running.setdefault(link, _Job())
+            if event.kind == STARTED:
+                job.track = event.track
+            elif event.kind == BYTES:
+                job.bytes_total += event.bytes
+            elif event.kind == PERCENT:
+                job.percent = max(job.percent, min(100.0, event.percent))
+            elif event.kind == ERROR:
+                job.errors.append(event.message)
+            elif event.kind == FINISHED and event.track is not None:
+                # "Completed download of <path>"
+                job.files.append(event.track)
+
+    def done(self, link: str) -> float:
+        """Marks a download as over (whichever way it went). Returns the bytes it downloaded."""
+        with self.lock:
+            job = self.running.pop(link, None)
+            if job is None:
+                return 0.0
+            if job.files:
+                self.written[link] = job.files
+                while len(self.written) > MAX_WRITTEN:
+                    self.written.popitem(last=False)
+            downloaded = job.bytes_total if not job.errors else job.bytes_done
+            self.finished_bytes += downloaded
+            return downloaded
+
+    def take_files(self, link: str) -> list[str]:
+        """The files the last download of the link wrote, forgotten once taken."""
+        with self.lock:
+            return self.written.pop(link, [])
+
+    def errors(self, link: str) -> list[str]:
+        """The errors Deemix printed for a running download."""
+        with self.lock:
+            job = self.running.get(link)
+            return list(job.errors) if job is not None else []
+
+    def throughput(self) -> float:
+        """Bytes per second downloaded since the last `reset()`, over every download."""
+        with self.lock:
+            done = self.finished_bytes + sum(job.bytes_done for job in self.running.values())
+            elapsed = time.monotonic() - self.started
+        return done / elapsed if elapsed > 0 else 0.0
+
+    def rate(self, window: float = 3.0) -> float:
+        """
+        Bytes per second downloaded over the last `window` seconds, over every download. Unlike `self.throughput()`,
+        this goes back down as soon as downloads slow down, e.g. for `DownloadScheduler(bandwidth=...)`.
+
+        Args:
+            window (float): Defaults to 3.0. Seconds to average over.
+
+        Returns:
+            float: The bytes per second, 0.0 until there are two calls to go by.
+        """
+        now = time.monotonic()
+        with self.lock:
+            done = self.finished_bytes + sum(job.bytes_done for job in self.running.values())
+            self.samples.append((now, done))
+            while len(self.samples) > 2 and now - self.samples[1][0] >= window:
+                self.samples.popleft()
+            then, before = self.samples[0]
+        return (done - before) / (now - then) if now > then else 0.0
+
+    def eta(self) -> Optional[float]:
+        """Seconds until every running download is done, going by how far each one got. None if unknown."""
+        now = time.monotonic()
+        etas = []
+        with self.lock:
+            for job in self.running.values():
+                if job.percent <= 0:
+                    return None
+                etas.append((now - job.started) * (100 - job.percent) / job.percent)
+        return max(etas) if etas else 0.0
+
+    def summary(self) -> str:
+        """A short "x.x MB/s, ETA mm:ss" for the status line."""
+        eta = self.eta()
+        eta = "?" if eta is None else f"{int(eta) // 60:02d}:{int(eta) % 60:02d}"
+        return f"{self.throughput() / 1_000_000:.1f} MB/s, ETA {eta}"
@@ -0,0 +1,120 @@
+"""
+ratelimit.py -> A token bucket shared by every Deezer request, which slows down (and backs off) when Deezer throttles us.
+"""
+
+import time
+import random
+import threading
+
+
+class RateLimiter:
+    """
+    Token bucket that adapts to throttling: the rate is halved when Deezer says we're going too fast
+    and creeps back up by a small step on each request that goes through.
+
+    The Deezer API allows 50 requests every 5 seconds, so the defaults keep just under that.
+
+    Args:
+        rate (float): Defaults to 9. Requests per second to allow at most.
+        burst (int): Defaults to 10. Requests that can go at once after being idle.
+        min_rate (float): Defaults to 1. The rate is never lowered below this.
+        backoff (float): Defaults to 0.5. Seconds waited after the first throttled response, doubling each retry.
+        max_backoff (float): Defaults to 30. The longest a single backoff can be.
+        recovery (float): Defaults to 0.5. Requests per second given back for each request that goes through.
+    """
+    def __init__(
+        self,
+        rate: float = 9,
+        burst: int = 10,
+        min_rate: float = 1,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        recovery: float = 0.5
+    ) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.recovery = recovery
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+        self.counters = {
+            "requests": 0,
+            "throttled": 0,
+            "retries": 0,
+            "errors": 0,
+            "waited": 0.0,
+        }
+
+    def acquire(self) -> None:
+        """Blocks until a request is allowed to go."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.counters["requests"] += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.counters["waited"] += wait
+            time.sleep(wait)
+
+    def success(self) -> None:
+        """Call after a request went through. Slowly gives back the rate taken by `throttled()`."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def throttled(self, attempt: int) -> float:
+        """
+        Call when Deezer throttled a request. Halves the rate, empties the bucket and returns how long to back off.
+
+        Args:
+            attempt (int): How many times this request has been throttled already (0 the first time).
+
+        Returns:
+            float: Seconds to wait before trying again (exponential, with full jitter).
+        """
+        with self.lock:
+            self.counters["throttled"] += 1
+            self.counters["retries"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+        return self.__backoff(attempt)
+
+    def retry(self, attempt: int) -> float:
+        """
+        Call when a request couldn't be made at all (DNS, a reset connection, a timeout). Unlike `throttled()`,
+        the rate is left alone, since it says nothing about how fast Deezer lets us go.
+
+        Args:
+            attempt (int): How many times this request has been retried already (0 the first time).
+
+        Returns:
+            float: Seconds to wait before trying again (exponential, with full jitter).
+        """
+        with self.lock:
+            self.counters["retries"] += 1
+        return self.__backoff(attempt)
+
+    def __backoff(self, attempt: int) -> float:
+        wait = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        with self.lock:
+            self.counters["waited"] += wait
+        return wait
+
+    def error(self) -> None:
+        """Call when a request failed for good."""
+        with self.lock:
+            self.counters["errors"] += 1
+
+    def stats(self) -> dict[str, float]:
+        """Returns the counters, along with the current rate."""
+        with self.lock:
+            return {**self.counters, "rate": round(self.rate, 2)}
@@ -0,0 +1,281 @@
+"""
+scheduler.py -> Runs several downloads at once, retrying the ones that fail. Interactive links go first,
+then the shortest (singles before albums), with an optional cap on the bandwidth all of them use together.
+"""
+
+import math
+import time
+import queue
+import itertools
+import threading
+
+from typing import Callable, Optional
+from concurrent.futures import Future
+
+from lib.metrics import METRICS
+
+# the per-link results of a download
+OK = "ok"
+TIMEOUT = "timeout"
+FAILED = "failed"
+
+# priorities, lower goes first. any int works, these are the usual ones
+INTERACTIVE = 0
+BATCH = 10
+
+# seconds after starting a download before `bandwidth` lets another one start, so the rate it's checked against
+# includes the one just started
+SETTLE = 2.0
+
+# places in the queue a link gives up for each track past the first, so singles overtake albums,
+# but an album is never overtaken by more than this many links per track (it doesn't wait forever)
+AGING = 10
+
+
+def estimate_cost(link: str) -> int:
+    """A guess of the tracks behind a link, without asking Deezer (see `Dzr.track_count()` for the real amount)."""
+    if "/album/" in link:
+        return 12
+    if "/playlist/" in link:
+        return 50
+    if "/artist/" in link:
+        return 100
+    return 1
+
+
+class DownloadScheduler:
+    """
+    Feeds links to a fixed amount of worker threads, each running one download at a time.
+
+    Links are taken by priority, then shortest job first: each link's place is the order it was submitted in,
+    pushed back `AGING` places for each track it's estimated to have past the first. A link submitted again with a
+    better priority while it's still waiting is moved up instead of being queued twice.
+
+    Args:
+        download (Callable[[str], str]): Downloads one link and returns OK, TIMEOUT or FAILED (e.g. `Dzr.download_status`).
+        workers (int): Defaults to 4. Amount of downloads running at once.
+        retries (int): Defaults to 2. How many more times a timed out or failed link is tried.
+        on_update (Callable[[str, str], None]): Optional. Called with (link, result) each time a link is done for good.
+        keep_results (bool): Defaults to True. If False, only `self.counts` is kept, so memory stays flat however many links go through.
+        max_pending (int): Optional. If set, `submit` blocks while this many links are queued or running.
+        verify (Callable[[str], Future]): Optional. Checks a link once it downloaded OK (e.g. `Verifier.verify`), off the
+            worker thread so the next download starts straight away. If the future resolves to False, the link is retried.
+        cost (Callable[[str], int]): Defaults to `estimate_cost`. The tracks behind a link, for shortest job first.
+        bandwidth (float): Optional. Bytes per second all the downloads may use together. Downloads can't be slowed down,
+            so no new one is started while `throughput()` is above it (one always runs), nor within `SETTLE` seconds of the last start.
+        throughput (Callable[[], float]): The bytes per second downloaded right now, e.g. `ProgressTracker.rate`. Needed for `bandwidth`.
+    """
+    def __init__(
+        self,
+        download: Callable[[str], str],
+        workers: int = 4,
+        retries: int = 2,
+        on_update: Optional[Callable[[str, str], None]] = None,
+        keep_results: bool = True,
+        max_pending: Optional[int] = None,
+        verify: Optional[Callable[[str], Future]] = None,
+        cost: Callable[[str], int] = estimate_cost,
+        bandwidth: Optional[float] = None,
+        throughput: Optional[Callable[[], float]] = None
+    ) -> None:
+        self.download = download
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.on_update = on_update
+        self.keep_results = keep_results
+        self.verify = verify
+        self.cost = cost
+        self.bandwidth = bandwidth if bandwidth and throughput is not None else None
+        self.throughput = throughput
+
+        # (priority, place, seq, link, attempt), see `self.__put()`
+        self.queue = queue.PriorityQueue()
+        self.seq = itertools.count()
+        # link -> (priority, seq, attempt) of its live entry, while it waits. other entries for it are stale and skipped
+        self.waiting: dict[str, tuple[int, int, int]] = {}
+        self.results = {}
+        self.counts = {OK: 0, TIMEOUT: 0, FAILED: 0}
+        # released once a link is done for good (not on a retry), so retries never block on it
+        self.pending = threading.Semaphore(max_pending) if max_pending else None
+        self.running = 0
+        self.verifying = 0
+        # when `self.__admit()` lets the next download start, at the earliest
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self) -> None:
+        """Starts the worker threads. Links can be submitted before or after."""
+        if len(self.threads) > 0:
+            return
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.__worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, link: str, priority: int = BATCH, cost: Optional[int] = None) -> None:
+        """
+        Queues a link for download. If it's already waiting, it's only moved up (if `priority` is better).
+
+        Args:
+            link (str): The Deezer link.
+            priority (int): Defaults to BATCH. Lower goes first, e.g. INTERACTIVE.
+            cost (int): Optional. The tracks behind the link, defaults to `self.cost(link)`.
+
+        Returns:
+            None
+        """
+        if self.promote(link=link, priority=priority, cost=cost) is not None:
+            return
+        if self.pending is not None:
+            self.pending.acquire()
+        with self.lock:
+            queued = link not in self.waiting
+            if queued:
+                self.__put(link=link, attempt=0, priority=priority, cost=cost)
+        if not queued:
+            # submitted from another thread in the meantime
+            if self.pending is not None:
+                self.pending.release()
+            self.promote(link=link, priority=priority, cost=cost)
+
+    def promote(self, link: str, priority: int, cost: Optional[int] = None) -> Optional[bool]:
+        """
+        Moves a link which is still waiting up to `priority`, if that's better than the one it has.
+
+        Returns:
+            Optional[bool]: If it was moved up, None if it isn't waiting (running, done or never submitted).
+        """
+        with self.lock:
+            waiting = self.waiting.get(link)
+            if waiting is None:
+                return None
+            if priority >= waiting[0]:
+                return False
+            self.__put(link=link, attempt=waiting[2], priority=priority, cost=cost)
+            return True
+
+    def __put(self, link: str, attempt: int, priority: int, cost: Optional[int] = None) -> None:
+        """Queues an entry for the link, making it the live one. Lock must be held."""
+        seq = next(self.seq)
+        place = seq + (max(1, cost if cost is not None else self.cost(link)) - 1) * AGING
+        self.waiting[link] = (priority, seq, attempt)
+        self.queue.put((priority, place, seq, link, attempt))
+
+    def join(self) -> dict[str, str]:
+        """
+        Waits for every queued link to be done, then stops the workers.
+
+        Returns:
+            dict[str, str]: link -> OK | TIMEOUT | FAILED, in the order the links finished.
+        """
+        self.queue.join()
+        for _ in self.threads:
+            self.queue.put((math.inf, 0, next(self.seq), None, 0))
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+        return self.results
+
+    def run(self, links: list[str]) -> dict[str, str]:
+        """
+        Downloads all of the links and waits for them.
+
+        Args:
+            links (list[str]): The Deezer links.
+
+        Returns:
+            dict[str, str]: link -> OK | TIMEOUT | FAILED, in the same order as `links`.
+        """
+        for link in links:
+            self.submit(link)
+        self.start()
+        results = self.join()
+        return {link: results[link] for link in links}
+
+    def __admit(self) -> None:
+        """
+        Waits while the downloads already running use up `self.bandwidth`, then counts this one as running.
+        Both happen under `self.lock`, so workers finding links at the same time are let through one by one.
+        """
+        waited = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.bandwidth is None or self.running == 0 or (now >= self.next_start and self.throughput() <= self.bandwidth):
+                    self.running += 1
+                    self.next_start = now + SETTLE
+                    return
+            if not waited:
+                METRICS.inc("scheduler_bandwidth_waits_total")
+                waited = True
+            time.sleep(0.2)
+
+    def __worker(self) -> None:
+        while True:
+            priority, _, seq, link, attempt = self.queue.get()
+            if link is None:
+                self.queue.task_done()
+                return
+            with self.lock:
+                if self.waiting.get(link, (None, None, None))[1] != seq:
+                    # moved up since, this is the entry it left behind
+                    self.queue.task_done()
+                    continue
+                del self.waiting[link]
+            # after taking the link, so workers which were idle (or just started) don't all start at once
+            self.__admit()
+            try:
+                result = self.download(link)
+            except Exception:
+                result = FAILED
+            with self.lock:
+                self.running -= 1
+            if result == OK and self.verify is not None:
+                # `task_done` waits for the check, so `join` still waits for every link
+                with self.lock:
+                    self.verifying += 1
+                try:
+                    future = self.verify(link)
+                except Exception:
+                    future = None
+                if future is not None:
+                    future.add_done_callback(
+                        lambda future, link=link, attempt=attempt, priority=priority: self.__verified(link, attempt, priority, future)
+                    )
+                    continue
+                with self.lock:
+                    self.verifying -= 1
+            self.__result(link=link, attempt=attempt, result=result, priority=priority)
+            self.queue.task_done()
+
+    def __verified(self, link: str, attempt: int, priority: int, future: Future) -> None:
+        try:
+            valid = future.result() is not False
+        except Exception:
+            # the check broke, not the download
+            valid = True
+        with self.lock:
+            self.verifying -= 1
+        self.__result(link=link, attempt=attempt, result=OK if valid else FAILED, priority=priority)
+        self.queue.task_done()
+
+    def __result(self, link: str, attempt: int, result: str, priority: int) -> None:
+        """Retries the link, or records its result for good."""
+        if result != OK and attempt < self.retries:
+            # back behind the links of its priority so they aren't held up by it. unless it was submitted
+            # again while running, then that one is its retry and this one is done
+            with self.lock:
+                retry = link not in self.waiting
+                if retry:
+                    self.__put(link=link, attempt=attempt + 1, priority=priority)
+            if retry:
+                return
+        with self.lock:
+            self.counts[result] += 1
+            if self.keep_results:
+                self.results[link] = result
+        if self.pending is not None:
+            self.pending.release()
+        if self.on_update is not None:
+            self.on_update(link, result)
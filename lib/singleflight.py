@@ -0,0 +1,72 @@
+"""
+singleflight.py -> Merges identical calls made at the same time (e.g. the same search from two threads) into one.
+"""
+
+import threading
+
+from typing import Callable, Hashable, TypeVar
+
+from lib.metrics import METRICS
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function once per key at a time. Callers asking for a key which is already running wait for that call
+    and get its result (or its exception) instead of running the function again.
+    Nothing is kept once the call is done, that's what the caches are for.
+
+    Args:
+        name (str): Labels the "singleflight_shared_total" counter, e.g. "search".
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        """
+        Args:
+            key (Hashable): What makes two calls the same.
+            function (Callable[[], T]): The call, only run if no call with the key is running.
+
+        Returns:
+            T: What the function returned, for whichever caller ran it.
+
+        Raises:
+            Exception: Whatever the function raised.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        if not leader:
+            METRICS.inc("singleflight_shared_total", {"name": self.name})
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.calls)
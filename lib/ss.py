@@ -4,23 +4,47 @@ ss -> Smart Sort for sorting the media files based on their artist name & album
 
 import os
 import re
+import json
+import time
 import shutil
 
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
 from tinytag import TinyTag
+from rich.table import Table
 from rich.console import Console
 
+from lib.metrics import METRICS
+
 class SmartSort:
-    def __init__(self, music_dir: str) -> None:
-        self.music_dir = music_dir
+    """
+    Moves every song & album at the top of the music directory into a folder of its artist.
+
+    Only entries which are new since the last sort are looked at, reading the tags is done on a thread pool,
+    and the moves are plain renames using absolute paths (the working directory is never changed).
+
+    Args:
+        music_dir (str): The music directory to sort.
+        state_file (str): Defaults to "config/ss_state.json". Remembers what the last sort already looked at.
+        workers (int): Defaults to 8. Amount of files having their tags read at once.
+    """
+    def __init__(self, music_dir: str, state_file: str = "config/ss_state.json", workers: int = 8) -> None:
+        self.music_dir = os.path.abspath(music_dir)
+        self.state_file = state_file
+        self.workers = workers
 
         self.console = Console()
 
-    def get_artist(self, filename: str) -> str:
+    def get_artist(self, filename: str) -> Optional[str]:
         try:
             return TinyTag.get(filename).artist
         except PermissionError:
             # if filename isnt a file name but is a folder instead
             return None
+        except Exception:
+            # not a media file (or a broken one), so there's nothing to sort it by
+            return None
 
     def create_folder(self, foldername: str) -> bool:
         """Make a folder based on the artist and return if made or determine if made already."""
@@ -30,35 +54,127 @@ class SmartSort:
             pass
         return os.path.isdir(foldername)
 
-    def sort(self) -> None:
-        songs = os.listdir(self.music_dir)
-        os.chdir(self.music_dir)
-        
-        with self.console.status("[yellow]Moving songs...", spinner="line") as status:
-            for song in songs:
-                # INFO: perform the check here if "song" is a dir and if it is, match with regex
-                # INFO: if it is, then create the folder & then move it into the newly made folder
-                # check = re.search(r"\S+-\S+", song)
-                check = re.search(r"(.+?)\s*-\s*", song)
-                if check:
-                    artist = check.group(1).strip()
-                    if len(artist) == 1:
-                        # a bug with the above regex which doesnt match n-aa artists
-                        # hacky workaround for checking the song's artist afterwards
-                        artist = re.search(r"\S+-\S+", song).group().split()
+    def __load_state(self) -> dict:
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        # "folders" -> the artist folders, "unsorted" -> name: mtime of entries with no artist to go by
+        return {"folders": state.get("folders", []), "unsorted": state.get("unsorted", {})}
+
+    def __save_state(self, state: dict) -> None:
+        if os.path.dirname(self.state_file):
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file, 'w') as f:
+            f.write(json.dumps(state, indent=2))
+
+    def __artist_from_name(self, song: str) -> Optional[str]:
+        # INFO: perform the check here if "song" is a dir and if it is, match with regex
+        # INFO: if it is, then create the folder & then move it into the newly made folder
+        # check = re.search(r"\S+-\S+", song)
+        check = re.search(r"(.+?)\s*-\s*", song)
+        if not check:
+            return None
+        artist = check.group(1).strip()
+        if len(artist) == 1:
+            # a bug with the above regex which doesnt match n-aa artists
+            # hacky workaround for checking the song's artist afterwards
+            artist = re.search(r"\S+-\S+", song).group()
+        return artist
+
+    def plan(self) -> list[tuple[str, str]]:
+        """
+        Works out where each new entry of the music directory goes, without moving anything.
+
+        Returns:
+            list[tuple[str, str]]: (absolute path of the song/album, absolute path of the artist folder it goes into).
+        """
+        state = self.__load_state()
+        known_folders = set(state["folders"])
+        moves = []
+        needs_tags = []
+        with os.scandir(self.music_dir) as entries:
+            for entry in entries:
+                if entry.name in known_folders:
+                    continue
+                if state["unsorted"].get(entry.name) == entry.stat().st_mtime:
+                    # looked at last time and there was nothing to sort it by
+                    continue
+                artist = self.__artist_from_name(entry.name)
+                if artist is not None:
                     # INFO: this gets the artist name and knows that this object is an album
-                    self.create_folder(artist)
-                    shutil.move(song, artist)
-                    status.update(f"[green]Moved {song} into {artist}")
-                else:
-                    artist = self.get_artist(song)
-                    if artist is not None:
-                        self.create_folder(artist)
-                        shutil.move(song, artist)
-                        status.update(f"[green]Moved {song} to {artist}!")
+                    moves.append((entry.path, artist))
+                elif entry.is_file():
+                    needs_tags.append(entry.path)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for path, artist in zip(needs_tags, executor.map(self.get_artist, needs_tags)):
+                if artist:
+                    moves.append((path, artist))
+
+        return [
+            # a "/" in the artist would otherwise make a folder inside a folder
+            (path, os.path.join(self.music_dir, artist.replace(os.sep, "_").strip()))
+            for path, artist in moves
+        ]
+
+    def sort(self, dry_run: bool = False) -> list[tuple[str, str]]:
+        """
+        Sorts the new entries of the music directory into their artist folders.
+
+        Args:
+            dry_run (bool): Defaults to False. If True, only print what would be moved where.
+
+        Returns:
+            list[tuple[str, str]]: The (source, artist folder) moves made, or that would be made.
+        """
+        started = time.perf_counter()
+        with self.console.status("[yellow]Reading tags...", spinner="line") as status:
+            with METRICS.timer("ss_plan_seconds"):
+                moves = self.plan()
+            if dry_run:
+                status.stop()
+                table = Table(title="Sort plan.")
+                table.add_column("Song / Album", justify="left")
+                table.add_column("Into", justify="left")
+                for path, folder in moves:
+                    table.add_row(os.path.basename(path), os.path.basename(folder))
+                self.console.print(table)
+                return moves
+
+            status.update("[yellow]Moving songs...")
+            moved = []
+            for path, folder in moves:
+                # an entry can itself be the folder of an artist with a "-" in their name
+                if path == folder:
+                    continue
+                self.create_folder(folder)
+                target = os.path.join(folder, os.path.basename(path))
+                if os.path.exists(target):
+                    status.update(f"[red]{os.path.basename(path)} is already in {os.path.basename(folder)}")
+                    continue
+                try:
+                    # same file system, so a rename is all it takes
+                    os.rename(path, target)
+                except OSError:
+                    shutil.move(path, target)
+                moved.append((path, folder))
+                status.update(f"[green]Moved {os.path.basename(path)} into {os.path.basename(folder)}")
             status.stop()
-        os.chdir("../")
+
+        state = self.__load_state()
+        folders = set(state["folders"]) | {os.path.basename(folder) for _, folder in moves}
+        unsorted = {}
+        with os.scandir(self.music_dir) as entries:
+            for entry in entries:
+                if entry.name not in folders:
+                    unsorted[entry.name] = entry.stat().st_mtime
+        self.__save_state({"folders": sorted(folders), "unsorted": unsorted})
+        METRICS.observe("ss_sort_seconds", time.perf_counter() - started)
+        METRICS.inc("ss_moved_total", amount=len(moved))
         self.console.print("[green]Moved all songs into their respective folder!")
+        return moved
     
 if __name__ == '__main__':
     ss = SmartSort(
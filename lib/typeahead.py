@@ -0,0 +1,249 @@
+"""
+typeahead.py -> Search as you type for `ss`: debounced requests, results cached by query (and filtered from a shorter
+query's results while the request for the longer one is on its way) and the results of stale requests thrown away.
+"""
+
+import os
+import sys
+import time
+import threading
+
+from typing import Callable, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from lib.cache import normalize_query
+from lib.match import label
+from lib.metrics import METRICS
+
+# the keys `RawInput.read()` returns besides printable characters
+UP = "up"
+DOWN = "down"
+ENTER = "enter"
+BACKSPACE = "backspace"
+ESCAPE = "escape"
+
+_POSIX_KEYS = {"\x1b[A": UP, "\x1bOA": UP, "\x1b[B": DOWN, "\x1bOB": DOWN, "\r": ENTER, "\n": ENTER, "\x7f": BACKSPACE, "\x08": BACKSPACE}
+_WINDOWS_KEYS = {"H": UP, "P": DOWN}
+
+
+class RawInput:
+    """
+    Reads single key presses without waiting for enter, using `termios` (or `msvcrt` on Windows).
+
+        with RawInput() as keys:
+            for key in keys.read(timeout=0.05):
+                ...
+    """
+    def __enter__(self) -> "RawInput":
+        if os.name != "nt":
+            import tty
+            import termios
+            self.fd = sys.stdin.fileno()
+            self.old = termios.tcgetattr(self.fd)
+            # cbreak instead of raw, so Ctrl-C still raises KeyboardInterrupt
+            tty.setcbreak(self.fd)
+        return self
+
+    def __exit__(self, *args) -> None:
+        if os.name != "nt":
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.old)
+
+    def read(self, timeout: float) -> list[str]:
+        """
+        Waits up to `timeout` seconds for key presses.
+
+        Returns:
+            list[str]: The keys pressed, either printable characters or UP | DOWN | ENTER | BACKSPACE | ESCAPE.
+        """
+        if os.name == "nt":
+            return self.__read_windows(timeout)
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64).decode("utf-8", errors="ignore")
+        keys = []
+        index = 0
+        while index < len(data):
+            sequence = data[index:index + 3]
+            if sequence in _POSIX_KEYS:
+                keys.append(_POSIX_KEYS[sequence])
+                index += 3
+            elif data[index] == "\x1b":
+                # a lone escape, or an escape sequence which isn't handled (the rest of it is skipped)
+                if index + 1 < len(data) and data[index + 1] in "[O":
+                    index += 3
+                    continue
+                keys.append(ESCAPE)
+                index += 1
+            else:
+                keys.append(_POSIX_KEYS.get(data[index], data[index]))
+                index += 1
+        return [key for key in keys if len(key) > 1 or key.isprintable()]
+
+    def __read_windows(self, timeout: float) -> list[str]:
+        import msvcrt
+        deadline = time.monotonic() + timeout
+        while not msvcrt.kbhit():
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(0.01)
+        keys = []
+        while msvcrt.kbhit():
+            key = msvcrt.getwch()
+            if key in ("\x00", "\xe0"):
+                special = _WINDOWS_KEYS.get(msvcrt.getwch())
+                if special is not None:
+                    keys.append(special)
+            elif key == "\x03":
+                raise KeyboardInterrupt
+            elif key == "\r":
+                keys.append(ENTER)
+            elif key == "\x08":
+                keys.append(BACKSPACE)
+            elif key == "\x1b":
+                keys.append(ESCAPE)
+            elif key.isprintable():
+                keys.append(key)
+        return keys
+
+
+class Typeahead:
+    """
+    Keeps the results for what's typed so far up to date. Call `type()` on every edit, then read `self.results`
+    once `self.changed` is set.
+
+    A request is only made once typing pauses for `debounce` seconds. Until it's back, the results of the longest
+    cached query the new one starts with are filtered down to what still matches, so one more word shows straight away.
+    A request which is no longer for what's typed is cancelled if it hasn't started, or its results are only cached.
+
+    Args:
+        search (Callable[[str], list[dict]]): Searches Deezer, e.g. `Dzr.search_query`.
+        debounce (float): Defaults to 0.15. Seconds to wait after a key press before searching.
+        min_length (int): Defaults to 2. Queries shorter than this aren't searched.
+        max_cached (int): Defaults to 128. Queries whose results are kept in memory.
+    """
+    def __init__(
+        self,
+        search: Callable[[str], list[dict]],
+        debounce: float = 0.15,
+        min_length: int = 2,
+        max_cached: int = 128
+    ) -> None:
+        self.search = search
+        self.debounce = debounce
+        self.min_length = min_length
+        self.max_cached = max_cached
+
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.cache: OrderedDict[str, list[dict]] = OrderedDict()
+        self.generation = 0
+        self.timer: Optional[threading.Timer] = None
+        self.pending: Optional[Future] = None
+
+        self.query = ""
+        self.results: list[dict] = []
+        self.searching = False
+        self.error: Optional[str] = None
+
+    def type(self, query: str) -> None:
+        """
+        Sets what's typed so far.
+
+        Args:
+            query (str): The whole query, as typed.
+
+        Returns:
+            None
+        """
+        key = normalize_query(query)
+        with self.lock:
+            self.query = query
+            self.generation += 1
+            self.error = None
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.pending is not None and self.pending.cancel():
+                METRICS.inc("typeahead_cancelled_total")
+            self.pending = None
+
+            if len(key) < self.min_length:
+                self.results, self.searching = [], False
+            elif key in self.cache:
+                self.cache.move_to_end(key)
+                self.results, self.searching = self.cache[key], False
+                METRICS.inc("typeahead_cache_total", {"cache": "hit"})
+            else:
+                METRICS.inc("typeahead_cache_total", {"cache": "miss"})
+                self.results = self.__from_prefix(key=key, album="album" in query)
+                self.searching = True
+                self.timer = threading.Timer(self.debounce, self.__fire, args=(self.generation, query))
+                self.timer.daemon = True
+                self.timer.start()
+        self.changed.set()
+
+    def __from_prefix(self, key: str, album: bool) -> list[dict]:
+        """The results of the longest cached query `key` starts with, which still have all of its words in them. Lock must be held."""
+        prefix = max((cached for cached in self.cache if key.startswith(cached)), key=len, default=None)
+        if prefix is None:
+            return self.results
+        words = key.split()
+        filtered = []
+        for result in self.cache[prefix]:
+            try:
+                name = normalize_query(label(result, album=album))
+            except (KeyError, TypeError):
+                continue
+            # the last word can still be half typed, so it only has to start a word
+            if all(word in name for word in words[:-1]) and any(part.startswith(words[-1]) for part in name.split()):
+                filtered.append(result)
+        return filtered
+
+    def __fire(self, generation: int, query: str) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+            future = self.pending = self.executor.submit(self.search, query)
+        # outside of the lock: if the search is already done, `__done` runs right here and takes the lock itself
+        future.add_done_callback(lambda future: self.__done(generation, query, future))
+
+    def __done(self, generation: int, query: str, future: Future) -> None:
+        if future.cancelled():
+            return
+        try:
+            results = future.result()
+            error = None
+        except Exception as e:
+            results, error = None, str(e)
+        with self.lock:
+            if results is not None:
+                # kept even when stale, since backspacing goes back to it
+                self.cache[normalize_query(query)] = results
+                while len(self.cache) > self.max_cached:
+                    self.cache.popitem(last=False)
+            if generation != self.generation:
+                METRICS.inc("typeahead_stale_total")
+                return
+            self.pending = None
+            self.searching = False
+            if results is not None:
+                self.results = results
+            self.error = error
+        self.changed.set()
+
+    def snapshot(self) -> tuple[str, list[dict], bool, Optional[str]]:
+        """Returns (query, results, searching, error) as of now."""
+        with self.lock:
+            return self.query, list(self.results), self.searching, self.error
+
+    def close(self) -> None:
+        """Stops any pending request."""
+        with self.lock:
+            self.generation += 1
+            if self.timer is not None:
+                self.timer.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
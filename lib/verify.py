@@ -0,0 +1,379 @@
+"""
+verify.py -> Checks the files a download wrote before it counts as done: that the container is whole (a FLAC's last
+frame ends the file and covers every sample), if the duration is the one Deezer gave, and hashes the audio for dedup.
+"""
+
+import os
+import re
+import mmap
+import time
+import hashlib
+import unicodedata
+import multiprocessing
+
+from typing import TYPE_CHECKING, Optional
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from lib.metrics import METRICS
+
+if TYPE_CHECKING:
+    from lib.dzr import Dzr
+    from lib.library import LibraryIndex
+
+# seconds a file can be off from the duration Deezer gives (which is rounded), or 2% of it if that's more
+TOLERANCE = 3.0
+
+# folders looked through (the most recently changed first, at each of the two levels) for the album folder of a download
+RECENT_FOLDERS = 16
+
+# what Deemix replaces with "_" in file names (see `deemix.utils.pathtemplates.fixName`)
+_ILLEGAL = re.compile(r'[\0/\\:*?"<>|]')
+
+
+def _crc_table(poly: int, bits: int) -> list[int]:
+    top = 1 << (bits - 1)
+    mask = (1 << bits) - 1
+    table = []
+    for byte in range(256):
+        crc = byte << (bits - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) if crc & top else (crc << 1)
+        table.append(crc & mask)
+    return table
+
+
+_CRC8 = _crc_table(0x07, 8)
+_CRC16 = _crc_table(0x8005, 16)
+
+
+def _crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = _CRC8[crc ^ byte]
+    return crc
+
+
+def _crc16(data: bytes) -> int:
+    crc = 0
+    table = _CRC16
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def _skip_id3(data: bytes) -> int:
+    """Where the file starts after an ID3v2 tag, if it has one."""
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _frame_header(data: bytes, pos: int) -> Optional[tuple[int, int, bool]]:
+    """
+    Parses the FLAC frame header at `pos`, if there really is one (its CRC-8 matches).
+
+    Returns:
+        Optional[tuple[int, int, bool]]: (frame or sample number, block size, if the stream has variable block sizes).
+    """
+    try:
+        block_code, rate_code = data[pos + 2] >> 4, data[pos + 2] & 0x0F
+        channels, sample_size, reserved = data[pos + 3] >> 4, (data[pos + 3] >> 1) & 0x07, data[pos + 3] & 0x01
+        if block_code == 0 or rate_code == 15 or channels > 10 or sample_size == 3 or reserved:
+            return None
+        # the frame (or sample) number, coded like UTF-8
+        first = data[pos + 4]
+        for extra, (mask, bits) in enumerate(((0x80, 0x00), (0xE0, 0xC0), (0xF0, 0xE0), (0xF8, 0xF0), (0xFC, 0xF8), (0xFE, 0xFC), (0xFF, 0xFE))):
+            if first & mask == bits:
+                number = first & ~mask & 0xFF
+                break
+        else:
+            return None
+        index = pos + 5
+        for _ in range(extra):
+            if data[index] & 0xC0 != 0x80:
+                return None
+            number = (number << 6) | (data[index] & 0x3F)
+            index += 1
+
+        if block_code == 1:
+            block_size = 192
+        elif block_code <= 5:
+            block_size = 576 << (block_code - 2)
+        elif block_code == 6:
+            block_size = data[index] + 1
+            index += 1
+        elif block_code == 7:
+            block_size = int.from_bytes(data[index:index + 2], "big") + 1
+            index += 2
+        else:
+            block_size = 256 << (block_code - 8)
+        index += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+        if _crc8(data[pos:index]) != data[index]:
+            return None
+        return number, block_size, data[pos + 1] == 0xF9
+    except IndexError:
+        return None
+
+
+def _check_flac(data: bytes) -> tuple[Optional[str], float, int, int]:
+    """
+    Returns:
+        tuple: (the error or None, the duration in seconds, where the audio starts, where it ends).
+    """
+    start = _skip_id3(data)
+    if data[start:start + 4] != b"fLaC":
+        return "not a FLAC file", 0.0, 0, 0
+    pos = start + 4
+    info = None
+    while True:
+        if pos + 4 > len(data):
+            return "cut off in the metadata", 0.0, 0, 0
+        last, kind, length = data[pos] & 0x80, data[pos] & 0x7F, int.from_bytes(data[pos + 1:pos + 4], "big")
+        if kind == 0:
+            info = data[pos + 4:pos + 4 + length]
+        pos += 4 + length
+        if last:
+            break
+    if pos > len(data):
+        return "cut off in the metadata", 0.0, 0, 0
+    if info is None or len(info) < 34:
+        return "no STREAMINFO", 0.0, 0, 0
+    block_size = int.from_bytes(info[0:2], "big")
+    max_frame = int.from_bytes(info[7:10], "big")
+    packed = int.from_bytes(info[10:18], "big")
+    sample_rate, total = packed >> 44, packed & ((1 << 36) - 1)
+    if sample_rate == 0:
+        return "invalid STREAMINFO", 0.0, 0, 0
+    duration = total / sample_rate
+    if pos + 2 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xFE != 0xF8:
+        return "no audio after the metadata", duration, pos, len(data)
+
+    # the last frame has to end exactly at the end of the file (its CRC-16 is the last 2 bytes),
+    # and has to hold the last sample, otherwise the file was cut off
+    end = len(data)
+    crc = int.from_bytes(data[end - 2:end], "big")
+    floor = max(pos, end - (max_frame * 2 if max_frame else 1 << 20))
+    candidate = end - 2
+    tried = 0
+    while tried < 4:
+        candidate = data.rfind(b"\xff", floor, candidate)
+        if candidate < 0:
+            break
+        if data[candidate + 1] not in (0xF8, 0xF9):
+            continue
+        header = _frame_header(data, candidate)
+        if header is None:
+            continue
+        tried += 1
+        if _crc16(data[candidate:end - 2]) != crc:
+            continue
+        number, size, variable = header
+        first_sample = number if variable else number * block_size
+        if total and first_sample + size != total:
+            return f"cut off at {first_sample / sample_rate:.0f}s of {duration:.0f}s", duration, pos, end
+        return None, duration, pos, end
+    return "cut off in the last frame", duration, pos, end
+
+
+def _check_other(path: str, data: bytes) -> tuple[Optional[str], float, int, int]:
+    """MP3s & the rest: a header that's there, and the duration TinyTag reads (estimated from the size if need be)."""
+    from tinytag import TinyTag
+
+    start = _skip_id3(data)
+    end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+    if path.lower().endswith(".mp3") and (start + 2 > len(data) or data[start] != 0xFF or data[start + 1] & 0xE0 != 0xE0):
+        return "not an MP3 file", 0.0, start, end
+    try:
+        duration = TinyTag.get(path).duration or 0.0
+    except Exception as e:
+        return f"unreadable: {e}", 0.0, start, end
+    return None, duration, start, end
+
+
+def check_file(path: str) -> tuple[Optional[str], Optional[str], float]:
+    """
+    Checks one downloaded file. Runs in the process pool of `Verifier`, so it must stay a plain function.
+    The file is mapped rather than read, so a 50 MB FLAC isn't copied into every process.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        Optional[str]: The BLAKE2 hash of the audio (not the tags, so retagging doesn't change it), None if it's invalid.
+        Optional[str]: Why the file is invalid, None if it's fine.
+        float: Its duration in seconds, 0.0 if unknown.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None, "empty", 0.0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if path.lower().endswith(".flac"):
+                    error, duration, start, end = _check_flac(data)
+                else:
+                    error, duration, start, end = _check_other(path, data)
+                if error is not None:
+                    return None, error, duration
+                digest = hashlib.blake2b(digest_size=16)
+                for block in range(start, end, 1 << 20):
+                    digest.update(data[block:min(end, block + (1 << 20))])
+                return digest.hexdigest(), None, duration
+    except OSError as e:
+        return None, f"unreadable: {e}", 0.0
+
+
+def sanitize(name: str) -> str:
+    """A title or file name the way Deemix writes it, to compare the two: "What's Up?" -> "what's up_"."""
+    return _ILLEGAL.sub("_", unicodedata.normalize("NFKC", name)).casefold().strip()
+
+
+def resolve(path: str, root: str, folder: Optional[str] = None) -> Optional[str]:
+    """
+    Where a file Deemix says it wrote really is. Deemix prints it relative to the folder of the download,
+    e.g. "/Artist - Title.flac", which for albums & playlists is a folder of its own somewhere in `root`.
+
+    Args:
+        path (str): The path, as printed after "Completed download of".
+        root (str): The music folder.
+        folder (str): Optional. Where the other files of the same download were, looked in first.
+
+    Returns:
+        Optional[str]: The path of the file, None if it can't be found.
+    """
+    if os.path.isabs(path) and os.path.isfile(path):
+        return path
+    relative = path.lstrip("/\\")
+    for base in ([folder] if folder else []) + [root]:
+        candidate = os.path.join(base, relative)
+        if os.path.isfile(candidate):
+            return candidate
+    # the album's folder was just written to, so it's among the most recently changed ones (at most "%artist%/%album%" deep)
+    for top in _recent_folders(root):
+        for base in [top] + _recent_folders(top):
+            candidate = os.path.join(base, relative)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def _recent_folders(path: str) -> list[str]:
+    try:
+        with os.scandir(path) as entries:
+            folders = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.is_dir()]
+    except OSError:
+        return []
+    return [folder for _, folder in sorted(folders, reverse=True)[:RECENT_FOLDERS]]
+
+
+class Verifier:
+    """
+    Checks what each download wrote (as printed by Deemix, see `ProgressTracker.take_files()`), on a pool of processes
+    so it keeps up with the downloads. Invalid files are deleted, so downloading the link again doesn't skip them
+    as "already downloaded", and the hashes of valid ones go into the library for dedup.
+
+    A file whose duration isn't the one Deezer gives is kept and only noted in `self.failures`: the title it's
+    matched to could be the wrong one, and downloading it again would most likely give the same file.
+
+    Args:
+        dzr (Dzr): For the music folder, the files each link wrote & the durations Deezer gives.
+        library (LibraryIndex): Optional. Where the hashes are stored.
+        workers (int): Defaults to 4. Files checked at once.
+        tolerance (float): Defaults to `TOLERANCE`. Seconds a duration can be off by.
+    """
+    def __init__(self, dzr: "Dzr", library: Optional["LibraryIndex"] = None, workers: int = 4, tolerance: float = TOLERANCE) -> None:
+        self.dzr = dzr
+        self.library = library
+        self.tolerance = tolerance
+
+        # spawned, since forking a process with threads running can deadlock
+        self.processes = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+        # waits on the processes for each link, so the download workers don't have to
+        self.threads = ThreadPoolExecutor(max_workers=max(1, workers))
+        # path -> what was wrong with it, the most recent last
+        self.failures: dict[str, str] = {}
+
+    def verify(self, link: str) -> Future:
+        """
+        Starts checking what the link wrote, e.g. as `DownloadScheduler(verify=...)`.
+
+        Args:
+            link (str): The Deezer link, just downloaded.
+
+        Returns:
+            Future: Resolves to True if every file is fine (or there was nothing to check), False if not.
+        """
+        return self.threads.submit(self.check, link)
+
+    def check(self, link: str) -> bool:
+        """Checks what the link wrote, waiting for it. See `self.verify()`."""
+        started = time.monotonic()
+        files = []
+        folder = None
+        for printed in self.dzr.progress.take_files(link):
+            path = resolve(printed, root=self.dzr.music_dir, folder=folder)
+            if path is None:
+                # not where it was expected, which says nothing about the file
+                METRICS.inc("verify_files_total", {"result": "skipped"})
+                continue
+            folder = os.path.dirname(path)
+            files.append(path)
+        if len(files) == 0:
+            METRICS.inc("verify_total", {"result": "skipped"})
+            return True
+        durations = self.dzr.durations(link)
+        futures = {path: self.processes.submit(check_file, path) for path in files}
+        valid = True
+        for path, future in futures.items():
+            try:
+                digest, error, actual = future.result()
+            except Exception:
+                # the pool itself broke, which says nothing about the file
+                METRICS.inc("verify_files_total", {"result": "skipped"})
+                continue
+            if error is not None:
+                valid = False
+                METRICS.inc("verify_files_total", {"result": "invalid"})
+                self.__fail(path, error)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            expected = self.__duration(path, durations)
+            if expected and actual and abs(actual - expected) > max(self.tolerance, expected * 0.02):
+                METRICS.inc("verify_files_total", {"result": "mismatch"})
+                self.__fail(path, f"{actual:.0f}s long, Deezer says {expected:.0f}s (kept)")
+            else:
+                METRICS.inc("verify_files_total", {"result": "ok"})
+            if self.library is not None and digest is not None:
+                self.library.set_hash(path=path, digest=digest)
+        METRICS.inc("verify_total", {"result": "ok" if valid else "invalid"})
+        METRICS.observe("verify_seconds", time.monotonic() - started)
+        return valid
+
+    def __fail(self, path: str, error: str) -> None:
+        self.failures.pop(path, None)
+        self.failures[path] = error
+        if len(self.failures) > 100:
+            self.failures.pop(next(iter(self.failures)))
+
+    def __duration(self, path: str, durations: dict[str, int]) -> Optional[int]:
+        """
+        The duration of the track the file is for, if its name is exactly one of the titles: the title itself or
+        "... - %title%" (what Deemix's "%artist% - %title%" & "%tracknumber% - %title%" give).
+        """
+        if len(durations) == 1:
+            return next(iter(durations.values()))
+        name = sanitize(os.path.splitext(os.path.basename(path))[0])
+        matches = [
+            (len(title), duration) for title, duration in ((sanitize(title), duration) for title, duration in durations.items())
+            if title and (name == title or name.endswith(f" - {title}"))
+        ]
+        # the longest, for "Up" & "Give It Up" on the same album
+        return max(matches)[1] if matches else None
+
+    def close(self) -> None:
+        """Stops the processes, once whatever is being checked is done."""
+        self.threads.shutdown(wait=True)
+        self.processes.shutdown(wait=True, cancel_futures=True)
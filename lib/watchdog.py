@@ -0,0 +1,53 @@
+"""
+watchdog.py -> Decides when a download is stuck, going by its progress instead of a flat timeout.
+"""
+
+import time
+
+from typing import Optional
+
+STALLED = "stalled"
+HARD_CAP = "hard cap"
+
+
+class Watchdog:
+    """
+    Keeps track of when a download last made progress.
+
+    Args:
+        stall (float): Seconds without any progress before the download counts as stuck.
+        hard_cap (float): Seconds the download can take at most, progress or not.
+    """
+    def __init__(self, stall: float, hard_cap: float) -> None:
+        self.stall = stall
+        self.hard_cap = hard_cap
+
+        self.started = time.monotonic()
+        self.last_progress = self.started
+
+    def restart(self) -> None:
+        """Starts counting from now, e.g. once the download really starts after waiting for a free worker."""
+        self.started = time.monotonic()
+        self.last_progress = self.started
+
+    def progress(self) -> None:
+        """Marks that the download made progress just now."""
+        self.last_progress = time.monotonic()
+
+    def expired(self) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: STALLED | HARD_CAP if the download should be killed, otherwise None.
+        """
+        now = time.monotonic()
+        if now - self.started >= self.hard_cap:
+            return HARD_CAP
+        if now - self.last_progress >= self.stall:
+            return STALLED
+        return None
+
+    def remaining(self) -> float:
+        """Seconds until `expired()` would say so, if no progress is made in between."""
+        now = time.monotonic()
+        return max(0, min(self.started + self.hard_cap, self.last_progress + self.stall) - now)
+
@@ -0,0 +1,84 @@
+"""
+worker.py -> A long running Deemix process, started by `lib.engine.DeemixEngine`.
+
+Logs in with the ARL once, then downloads each link written to stdin (one per line).
+Deemix's own log lines are printed as they happen, and every link ends with a line of:
+
+    @@done {"link": ..., "status": "ok" | "failed", "error": ...}
+
+Before the first link, either "@@ready" or "@@error <reason>" is printed.
+"""
+
+import sys
+import json
+import argparse
+
+from pathlib import Path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--bitrate", default="FLAC")
+    args = parser.parse_args()
+
+    try:
+        from deezer import Deezer, TrackFormats
+        from deemix import generateDownloadObject
+        from deemix.settings import load as load_settings
+        from deemix.utils import getBitrateNumberFromText, formatListener
+        from deemix.downloader import Downloader
+        from deemix.itemgen import GenerationError
+    except ImportError as e:
+        print(f"@@error {e}", flush=True)
+        return 2
+
+    class Listener:
+        @classmethod
+        def send(cls, key, value=None) -> None:
+            log = formatListener(key, value)
+            if log:
+                print(log, flush=True)
+
+    # same layout as `deemix --portable`, so the config and the .arl are shared with it
+    config_folder = Path("config")
+    settings = load_settings(config_folder)
+    settings["downloadLocation"] = str(Path(args.path))
+    bitrate = getBitrateNumberFromText(args.bitrate) or settings.get("maxBitrate", TrackFormats.MP3_320)
+
+    dz = Deezer()
+    try:
+        with open(config_folder / ".arl", "r", encoding="utf-8") as f:
+            arl = f.readline().strip()
+    except FileNotFoundError:
+        print("@@error no ARL set", flush=True)
+        return 2
+    if not dz.login_via_arl(arl):
+        print("@@error invalid ARL", flush=True)
+        return 2
+    print("@@ready", flush=True)
+
+    listener = Listener()
+    for line in sys.stdin:
+        link = line.strip()
+        if not link:
+            continue
+        result = {"link": link, "status": "ok", "error": None}
+        try:
+            download_object = generateDownloadObject(dz, link, bitrate, {}, listener)
+            if not isinstance(download_object, list):
+                download_object = [download_object]
+            for obj in download_object:
+                Downloader(dz, obj, settings, listener).start()
+                if getattr(obj, "failed", 0):
+                    result.update(status="failed", error=f"{obj.failed} track(s) failed")
+        except GenerationError as e:
+            result.update(status="failed", error=f"{e.link}: {e.message}")
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        print(f"@@done {json.dumps(result)}", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,32 +1,76 @@
 import os
+import sys
 import json
+import time
+import threading
 
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Optional, Union
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from lib.dzr import Dzr
 from lib.ss import SmartSort
 from lib.design import Design
+from lib.cache import query_key
+from lib.journal import Journal, DOWNLOADED
+from lib.library import LibraryIndex
+from lib.metrics import METRICS
+from lib.scheduler import DownloadScheduler, OK, TIMEOUT, FAILED
 
 from rich.table import Table
 from rich.console import Console
-from rapidfuzz import process, fuzz
+
+if TYPE_CHECKING:
+    # `lib.dzr` (and so `requests`) is imported by `Main.dzr` the first time it's needed, see `Main.warm_up()`
+    from lib.dzr import Dzr
+    from lib.typeahead import Typeahead
+    from lib.verify import Verifier
+    from rich.status import Status
+    from rich.console import Group
+
+# links `Main.stream()` remembers having queued, the oldest are forgotten past this
+RECENT_LINKS = 4096
 
 class Main:
     def __init__(
             self, 
             song_file: str = "songs.txt", 
             bitrate: str = "FLAC",
-            music_dir: str = "./music/"
+            music_dir: str = "./music/",
+            workers: int = 8,
+            download_workers: int = 4,
+            console: Console = None
         ) -> None:
         self.songs_file = song_file
         self.music_dir = music_dir
         self.bitrate = bitrate
         self.timeout = 30
-        self.config_data = ""
-        self.console = Console()
-        self.dzr = Dzr(bitrate=self.bitrate, timeout=self.timeout)
+        self.workers = workers
+        self.download_workers = download_workers
+        self.retries = 2
+        # keep Deemix workers running between downloads instead of one `deemix` process per link
+        self.use_engine = True
+        # check each download's files (see `lib/verify.py`) and retry the ones which are cut off or the wrong length
+        self.verify = True
+        # bytes per second all the downloads may use together, None for no cap
+        self.bandwidth = None
+        # read from config/config.json the first time it's needed, see `self.config_data`
+        self.__config_data = None
+        # `lib/cli.py` passes a quiet one (or one on stderr), so only the summary goes to stdout
+        self.console = console if console is not None else Console()
+        # made the first time it's needed, see `self.dzr`
+        self.__dzr = None
+        self.__dzr_lock = threading.Lock()
+        # made the first time a download is verified, see `self.verifier`
+        self.__verifier = None
+        # None until `self.warm_up()` (or a command) has checked the ARL
+        self.arl_valid = None
         self.ss = SmartSort(music_dir=self.music_dir)
+        self.ss.console = self.console
+        # what has been searched & downloaded so far, so `sch`, `dl` & `st` can resume after being interrupted
+        self.journal = Journal()
+        # what's already in `self.music_dir`, so songs aren't downloaded twice
+        self.library = LibraryIndex(music_dir=self.music_dir)
 
         self.links = []
         # there will be an equal number of links as there are titles
@@ -36,11 +80,68 @@ class Main:
 
         self.clear = lambda: os.system('cls' if os.name == 'nt' else 'clear')
 
-        self.__get_config()
+    @property
+    def dzr(self) -> "Dzr":
+        """The `Dzr`, made (importing `lib.dzr` & `requests`) the first time it's needed, usually by `self.warm_up()`."""
+        with self.__dzr_lock:
+            if self.__dzr is None:
+                from lib.dzr import Dzr
+                self.__dzr = Dzr(bitrate=self.bitrate, music_dir=self.music_dir, timeout=self.timeout, max_workers=self.workers)
+            return self.__dzr
+
+    @property
+    def verifier(self) -> "Verifier":
+        """The `Verifier` for the downloads, made (starting its processes) the first time it's needed."""
+        # outside of the lock, which `self.dzr` takes too
+        dzr = self.dzr
+        with self.__dzr_lock:
+            if self.__verifier is None:
+                from lib.verify import Verifier
+                self.__verifier = Verifier(dzr=dzr, library=self.library, workers=self.download_workers)
+            return self.__verifier
+
+    def __verify(self) -> Union[Callable, None]:
+        """What the download schedulers check the downloads with, None if `self.verify` is off."""
+        if not self.verify:
+            return None
+        return self.verifier.verify
+
+    def stop_verifier(self) -> None:
+        """Stops the verifier's processes, once the files being checked are done."""
+        with self.__dzr_lock:
+            verifier, self.__verifier = self.__verifier, None
+        if verifier is not None:
+            verifier.close()
+
+    @property
+    def config_data(self) -> dict:
+        """The contents of config/config.json, read the first time they're needed."""
+        if self.__config_data is None:
+            self.__get_config()
+        return self.__config_data
+
+    def warm_up(self) -> threading.Thread:
+        """
+        While the user types their first command: imports `lib.dzr`, opens the connections to Deezer and checks the ARL,
+        so the first `ss` or `dr` is as fast as the ones after it.
+
+        Returns:
+            threading.Thread: The (daemon) thread doing it.
+        """
+        def warm() -> None:
+            try:
+                self.dzr.warm_up()
+                self.arl_valid = self.dzr.account().valid
+            except Exception:
+                # nothing lost, the first command connects (and fails) on its own
+                pass
+
+        thread = threading.Thread(target=warm, daemon=True)
+        thread.start()
+        return thread
     
     def __get_config(self) -> dict[str, str]:
         """
-        !! To only be ran on initialisation of the object. !!
         Very simply appends the contents of `self.config_data`.
 
         Args:
@@ -50,8 +151,8 @@ class Main:
             dict[str, str]: Returns the contents.
         """
         with open('./config/config.json', 'r') as f:
-            self.config_data = json.load(f)
-        return self.config_data
+            self.__config_data = json.load(f)
+        return self.__config_data
     
     def __get_value_of(self, option: str, display: bool = True) -> Union[bool, str]:
         """
@@ -80,30 +181,90 @@ class Main:
 
     def search(self) -> list[str]:
         self.links = []
+        self.titles = []
         self.could_not_find = []
         with self.console.status("Searching songs...", spinner="dots") as status:
-            with open("songs.txt", 'r') as f:
+            self.library.refresh()
+            with open(self.songs_file, 'r') as f:
                 songs = f.read().splitlines(keepends=False)
             if len(songs) == 0:
                 status.stop()
                 self.console.print("[red]There are no songs in the file!")
                 return
+            queries = []
+            # (normalized query, album) -> the lines with it, only the first one is searched
+            duplicates = {}
+            skipped = 0
             for song in songs:
-                if "https://www.deezer.com" in song or "https://deezer.com" in song:
+                if self.dzr.is_collection(song):
+                    status.update(f"Listing {song}...")
+                    try:
+                        new, total = self.__expand(song)
+                    except Exception:
+                        status.update(f"[red]Could not list {song}!")
+                        self.could_not_find.append(song)
+                        continue
+                    skipped += total - len(new)
+                    self.links += [link for link, _ in new]
+                    self.titles += [title for _, title in new]
+                    continue
+                # resume from the journal: downloaded lines are done, searched ones already have their link
+                known = self.journal.get(song)
+                if known is not None and known[0] == DOWNLOADED:
+                    skipped += 1
+                elif known is not None and known[1] is not None:
+                    self.titles.append(known[2] or known[1])
+                    self.links.append(known[1])
+                elif "https://www.deezer.com" in song or "https://deezer.com" in song:
                     status.update(f"Found {song} in songs.txt!")
                     # assume if the user adds a link to songs.txt then
                     # automatically add it to the array of found links
+                    self.journal.searched(line=song, link=song, title=song)
+                    self.titles.append(song)
                     self.links.append(song)
+                elif self.__isrc_in_library(song):
+                    skipped += 1
+                elif len(song.strip()) > 0:
+                    self.journal.pending(line=song)
+                    key = query_key(song)
+                    if key in duplicates:
+                        duplicates[key].append(song)
+                        continue
+                    duplicates[key] = [song]
+                    queries.append(song)
+
+            def on_result(song: str, result: tuple[str]) -> None:
+                nonlocal skipped
+                lines = duplicates[query_key(song)]
+                if result is None:
+                    status.update(f"[red]Could not find {song}!")
+                    for line in lines:
+                        self.journal.failed(line=line, reason="not found")
+                        self.could_not_find.append(line)
                 else:
-                    search, title = self.dzr.search(query=song)
-                    if search is None:
-                        status.update(f"[red]Could not find {song}!")
-                        self.could_not_find.append(song)
-                    else:
-                        status.update(f"Found: {title}")
-                        self.titles.append(title)
-                        self.links.append(search)
+                    search, title = result
+                    for line in lines:
+                        self.journal.searched(line=line, link=search, title=title)
+                    if self.__in_library(link=search, title=title):
+                        status.update(f"Already downloaded: {title}")
+                        self.journal.downloaded(link=search)
+                        skipped += len(lines)
+                        return
+                    status.update(f"Found: {title}")
+                    self.titles.append(title)
+                    self.links.append(search)
+
+            status.update(f"Searching {len(queries)} songs...")
+            self.dzr.search_many(queries=queries, max_workers=self.workers, on_result=on_result)
             status.stop()
+        merged = sum(len(lines) - 1 for lines in duplicates.values())
+        if merged > 0:
+            self.console.print(f"[yellow]Merged {merged} duplicate lines into the ones they repeat.[/yellow]")
+        if skipped > 0:
+            self.console.print(f"[yellow]Skipped {skipped} songs which were already downloaded.[/yellow]")
+        # different lines can find the same song
+        unique = dict(zip(self.links, self.titles))
+        self.links, self.titles = list(unique), list(unique.values())
         if len(self.links) == 1:
             extra_detail = f"There is {len(self.links)} song available to download!"
         else:
@@ -114,45 +275,338 @@ class Main:
                 f.write(f"{line}\n")
         return self.links
     
-    def download(self) -> None:
+    def download(self, links: Optional[list[str]] = None) -> dict[str, str]:
         """ 
-        Downloads the songs!
+        Downloads the songs! `self.download_workers` of them at once.
+
+        Args:
+            links (list[str]): Optional. What to download, defaults to what `sch` found (`self.links`).
+
+        Returns:
+            dict[str, str]: link -> "ok" | "timeout" | "failed"
         """
-        local_count = 0
-        if len(self.links) == 0:
+        requested = self.links if links is None else links
+        if len(requested) == 0:
             self.console.print("[yellow]Please run 'sch' to search the links then download!")
-            return
+            return {}
+        self.__start_engine()
         with self.console.status("[yellow]Downloading[/yellow]", spinner="dots") as status:
-            for song in self.links:
-                local_count += 1
-                if "album" in song:
-                    status.update("[yellow]Downloading album. This may take some time.[/yellow]")
+            def on_update(link: str, result: str) -> None:
+                done = len(scheduler.results)
+                if result == OK:
+                    self.journal.downloaded(link=link)
                 else:
-                    status.update(f"[light_green]Downloading song {local_count}/{len(self.links)}[/light_green]")
-                
-                try:
-                    self.dzr.download(song_link=song)
-                except UnicodeEncodeError:
-                    status.update(f"[red]Could not download: {song}[/red]")
+                    self.journal.download_failed(link=link, reason=result)
+                if result == OK:
+                    status.update(f"[light_green]Downloaded {done}/{len(pending)} ({scheduler.running} running, {self.dzr.progress.summary()})[/light_green]")
+                else:
+                    status.update(f"[red]Could not download: {link} ({result})[/red]")
+
+            scheduler = DownloadScheduler(
+                download=self.dzr.download_status,
+                workers=self.download_workers,
+                retries=self.retries,
+                on_update=on_update,
+                verify=self.__verify(),
+                bandwidth=self.bandwidth,
+                throughput=self.dzr.progress.rate
+            )
+            if any("album" in link for link in requested):
+                status.update("[yellow]Downloading albums. This may take some time.[/yellow]")
+            # a link can be downloaded already if the run before was interrupted after `search`,
+            # and several lines can end up on the same link
+            pending = [link for link in dict.fromkeys(requested) if not self.journal.is_downloaded(link)]
+            self.dzr.progress.reset()
+            stop = self.__show_progress(
+                status=status,
+                describe=lambda: f"[light_green]Downloaded {len(scheduler.results)}/{len(pending)} ({scheduler.running} running"
+            )
+            results = scheduler.run(links=pending)
+            stop.set()
             status.stop()
-            # remove the links and have the user search again for new ones
-            self.links.clear()
-            
+            if links is None:
+                # remove the links and have the user search again for new ones. not when given other links
+                # (e.g. by `self.sync()`), so what `sch` found is still there for `dl`
+                self.links.clear()
+                self.titles.clear()
+
+        failed = [link for link, result in results.items() if result != OK]
+        for link in failed:
+            self.console.print(f"[red]Could not download: {link} ({results[link]})[/red]")
         self.console.print(f"[green]Downloaded [b u]{self.__get_total()}[/b u] songs in total![/green]")
+        return results
     
+    def stream(self) -> dict[str, int]:
+        """
+        Searches and downloads at the same time: each line of `self.songs_file` is read as it's needed,
+        and its link goes straight to the downloads once it's found. Nothing is kept in `self.links`.
+
+        Returns:
+            dict[str, int]: Amount of links per result ("ok" | "timeout" | "failed"), plus "missing" for the lines not found.
+        """
+        self.__start_engine()
+        self.library.refresh()
+        missing = 0
+        lock = threading.Lock()
+        with self.console.status("[yellow]Searching & downloading...[/yellow]", spinner="dots") as status:
+            def on_update(link: str, result: str) -> None:
+                if result == OK:
+                    self.journal.downloaded(link=link)
+                else:
+                    self.journal.download_failed(link=link, reason=result)
+                status.update(f"{describe()}, {self.dzr.progress.summary()})[/light_green]")
+
+            def describe() -> str:
+                counts = scheduler.counts
+                return (
+                    f"[light_green]Downloaded {counts[OK]} ({counts[TIMEOUT] + counts[FAILED]} failed, "
+                    f"{scheduler.running} running, {missing} not found"
+                )
+
+            scheduler = DownloadScheduler(
+                download=self.dzr.download_status,
+                workers=self.download_workers,
+                retries=self.retries,
+                on_update=on_update,
+                keep_results=False,
+                max_pending=self.download_workers * 2,
+                verify=self.__verify(),
+                bandwidth=self.bandwidth,
+                throughput=self.dzr.progress.rate
+            )
+            scheduler.start()
+            self.dzr.progress.reset()
+            stop = self.__show_progress(status=status, describe=describe)
+            # bounds the searches in flight, so the file is never read much further ahead than the downloads
+            searching = threading.BoundedSemaphore(self.workers * 2)
+            # the links queued most recently, so lines repeating each other (or finding the same song) download once.
+            # only the last `RECENT_LINKS` are kept, so memory stays flat however long the file is: an older link is
+            # in the journal once downloaded, still waiting in the scheduler (which doesn't queue it twice) or running
+            # (and `Dzr.download_status` joins that download instead of starting another)
+            submitted = OrderedDict()
+
+            def queue(link: str) -> None:
+                with lock:
+                    if link in submitted:
+                        submitted.move_to_end(link)
+                        return
+                    submitted[link] = None
+                    if len(submitted) > RECENT_LINKS:
+                        submitted.popitem(last=False)
+                if self.journal.is_downloaded(link):
+                    return
+                scheduler.submit(link)
+
+            with open(self.songs_file, 'r') as songs, open('could_not_find.txt', 'w') as could_not_find:
+                def resolve(song: str) -> None:
+                    nonlocal missing
+                    try:
+                        result = self.dzr.search(query=song)
+                    except Exception:
+                        result = None
+                    finally:
+                        searching.release()
+                    if result is None:
+                        self.journal.failed(line=song, reason="not found")
+                        with lock:
+                            missing += 1
+                            could_not_find.write(f"{song}\n")
+                        return
+                    self.journal.searched(line=song, link=result[0], title=result[1])
+                    if self.__in_library(link=result[0], title=result[1]):
+                        self.journal.downloaded(link=result[0])
+                        return
+                    status.update(f"Found: {result[1]}")
+                    queue(result[0])
+
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    for line in songs:
+                        song = line.strip()
+                        if len(song) == 0:
+                            continue
+                        if self.dzr.is_collection(song):
+                            try:
+                                new, _ = self.__expand(song)
+                            except Exception:
+                                with lock:
+                                    missing += 1
+                                    could_not_find.write(f"{song}\n")
+                                continue
+                            for link, _ in new:
+                                queue(link)
+                            continue
+                        known = self.journal.get(song)
+                        if known is not None and known[0] == DOWNLOADED:
+                            continue
+                        if known is not None and known[1] is not None:
+                            queue(known[1])
+                            continue
+                        if "https://www.deezer.com" in song or "https://deezer.com" in song:
+                            self.journal.searched(line=song, link=song, title=song)
+                            queue(song)
+                            continue
+                        if self.__isrc_in_library(song):
+                            continue
+                        self.journal.pending(line=song)
+                        searching.acquire()
+                        executor.submit(resolve, song)
+            scheduler.join()
+            stop.set()
+            status.stop()
+
+        counts = {**scheduler.counts, "missing": missing}
+        self.console.print(
+            f"[green]Downloaded [b u]{counts[OK]}[/b u] songs, "
+            f"{counts[TIMEOUT] + counts[FAILED]} failed & {missing} not found![/green]"
+        )
+        return counts
+
+    def batch(self, sort: bool = False) -> dict:
+        """
+        Searches, downloads (see `self.stream()`) and optionally sorts, without asking anything. Used by `lib/cli.py`.
+
+        Args:
+            sort (bool): Defaults to False. If True, run SmartSort once the downloads are done.
+
+        Returns:
+            dict: The summary, "error" is set if it couldn't run at all.
+        """
+        import requests
+
+        started = time.perf_counter()
+        summary = {
+            "songs_file": self.songs_file,
+            "music_dir": self.music_dir,
+            "bitrate": self.bitrate,
+            "downloaded": 0,
+            "failed": 0,
+            "timeout": 0,
+            "not_found": 0,
+            "sorted": 0,
+            "error": None,
+        }
+        try:
+            if not os.path.isfile(self.songs_file):
+                summary["error"] = f"{self.songs_file} does not exist"
+            elif not self.dzr.account().valid:
+                summary["error"] = "invalid ARL"
+        except (OSError, requests.RequestException) as e:
+            summary["error"] = f"could not check the ARL: {e}"
+        if summary["error"] is None:
+            try:
+                counts = self.stream()
+            finally:
+                self.dzr.stop_engine()
+                self.stop_verifier()
+            summary.update(
+                downloaded=counts[OK],
+                failed=counts[FAILED],
+                timeout=counts[TIMEOUT],
+                not_found=counts["missing"],
+            )
+            if sort:
+                summary["sorted"] = len(self.ss.sort())
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    def __show_progress(self, status: "Status", describe: Callable[[], str]) -> threading.Event:
+        """
+        Keeps the status line up to date with the MB/s & ETA of the running downloads, until the returned event is set.
+
+        Args:
+            status (Status): The status line.
+            describe (Callable[[], str]): Returns the start of the line (the counts), the throughput is added on the end.
+
+        Returns:
+            threading.Event: Set it to stop updating.
+        """
+        stop = threading.Event()
+
+        def refresh() -> None:
+            while not stop.wait(0.5):
+                status.update(f"{describe()}, {self.dzr.progress.summary()})[/light_green]")
+
+        threading.Thread(target=refresh, daemon=True).start()
+        return stop
+
+    def __start_engine(self) -> None:
+        """Starts the warm Deemix workers the first time they're needed (if `self.use_engine`)."""
+        if not self.use_engine or self.dzr.engine is not None:
+            return
+        with self.console.status("[yellow]Starting Deemix workers...[/yellow]", spinner="dots"):
+            started = self.dzr.start_engine(workers=self.download_workers)
+        if not started:
+            self.use_engine = False
+            self.console.print(f"[yellow]Could not start the Deemix workers ({self.dzr.engine_error}), using one process per song.[/yellow]")
+
     def __get_total(self) -> int:
-        """Returns the amount of songs in the music directory."""
-        amount = 0
-        for _, _, files in os.walk("music"):
-            for file in files:
-                if file.endswith(f".{self.bitrate.lower()}"):
-                    amount += 1
-        return amount
+        """Returns the amount of songs in the music directory, from the library index."""
+        self.library.refresh()
+        return self.library.count(ext="flac" if self.bitrate == "FLAC" else "mp3")
+
+    def __isrc_in_library(self, song: str) -> bool:
+        """If the line is an "isrc:%isrc%" whose song is already in the music directory, so it needn't be looked up."""
+        song = song.strip()
+        return song.lower().startswith("isrc:") and self.library.has_isrc(song[5:].strip())
+
+    def __in_library(self, link: str, title: str) -> bool:
+        """If the search result (link & "%artist% - %title%") is already downloaded into the music directory."""
+        return self.library.has(name=title, album="/album/" in link)
+
+    def sync(self, link: str) -> None:
+        """
+        Downloads what's new in a playlist (or by an artist) since the last time, see `self.__expand()`.
+
+        Args:
+            link (str): The playlist or artist link.
+
+        Returns:
+            None
+        """
+        with self.console.status(f"Listing {link}...", spinner="dots"):
+            self.library.refresh()
+            try:
+                new, total = self.__expand(link)
+            except Exception as e:
+                self.console.print(f"[red]Could not list {link}: {e}[reset]")
+                return
+        if len(new) == 0:
+            self.console.print(f"[yellow]Nothing new, all {total} are already downloaded.[/yellow]")
+            return
+        self.console.print(f"[light_green]{len(new)} new of {total}, downloading them.[/light_green]")
+        self.download(links=[link for link, _ in new])
+
+    def __expand(self, link: str) -> tuple[list[tuple[str, str]], int]:
+        """
+        Lists a playlist's tracks (or an artist's albums), leaving out what's already downloaded or in the library.
+        The new ones go into the journal under their own link, so the next sync skips them once downloaded.
+
+        Args:
+            link (str): The playlist or artist link.
+
+        Returns:
+            list[tuple[str, str]]: The (link, title) of each one not downloaded yet.
+            int: How many there are in total.
+        """
+        entries = self.dzr.expand(link)
+        new = []
+        for entry, title in entries:
+            if self.journal.is_downloaded(entry):
+                continue
+            self.journal.searched(line=entry, link=entry, title=title)
+            if self.__in_library(link=entry, title=title):
+                self.journal.downloaded(link=entry)
+                continue
+            new.append((entry, title))
+        return new, len(entries)
 
     def direct_download(self, link: str) -> None:
         initial_prompt = "Downloading"
         title = ""
         prompt = ""
+        if self.dzr.is_collection(link):
+            self.sync(link=link)
+            return
         if "https://www.deezer.com" not in link:
             # then assume it's a query and search, then return the link for download
             with self.console.status(f"Searching {link}...", spinner="dots") as status:
@@ -162,9 +616,13 @@ class Main:
                     return
                 link, title = result
                 status.update(f"Found a match for {link}!")
+            if self.__in_library(link=link, title=title):
+                self.console.print(f"[yellow]{title} is already downloaded![/yellow]")
+                return
     
         # INFO: needs to be re-worked. shows the title, but SHOULD say something else if downloading an album
         prompt = f" {title}"
+        self.__start_engine()
         with self.console.status(initial_prompt + prompt, spinner="dots") as status:
             out = self.dzr.download(song_link=link)
         status.stop()
@@ -184,6 +642,7 @@ class Main:
         Returns:
             str: The name of the track that best matches.
         """
+        from rapidfuzz import process, fuzz
         return process.extract(query, songs, scorer=fuzz.WRatio, limit=1)
     
     def search_query(self, query: str) -> str:
@@ -250,14 +709,90 @@ class Main:
             except ValueError:
                 self.console.print("[b red]You need to enter a valid number.[reset]")
         
+        self.__download_chosen(link=decided, title=title)
+
+    def __download_chosen(self, link: str, title: str) -> None:
+        """Downloads the track/album picked from the search results."""
+        self.__start_engine()
         with self.console.status(f"Downloading '{title}'", spinner="dots") as status:
-            out = self.dzr.download(song_link=decided)
+            out = self.dzr.download(song_link=link)
         status.stop()
         if out:
             self.console.print(f"[green]Downloaded '{title}'![reset]")
             return
         self.console.print(self.invalid_arl_string)
 
+    def live_search(self) -> None:
+        """
+        `ss`, but the results update as you type (see `lib/typeahead.py`).
+        Up/down picks a result, enter downloads it and escape goes back to the menu.
+        """
+        from rich.live import Live
+        from lib.typeahead import RawInput, Typeahead, UP, DOWN, ENTER, BACKSPACE, ESCAPE
+
+        typeahead = Typeahead(search=self.dzr.search_query)
+        query = ""
+        selected = 0
+        chosen = None
+        try:
+            with RawInput() as keys, Live(
+                self.__typeahead_view(typeahead, selected), console=self.console, auto_refresh=False, transient=True
+            ) as live:
+                while chosen is None:
+                    pressed = keys.read(timeout=0.05)
+                    _, results, _, _ = typeahead.snapshot()
+                    for key in pressed:
+                        if key == ESCAPE:
+                            return
+                        elif key == ENTER:
+                            if results:
+                                chosen = results[min(selected, len(results) - 1)]
+                                break
+                        elif key == UP:
+                            selected = max(0, selected - 1)
+                        elif key == DOWN:
+                            selected = min(max(0, len(results) - 1), selected + 1)
+                        else:
+                            query = query[:-1] if key == BACKSPACE else query + key
+                            selected = 0
+                            typeahead.type(query.lower())
+                    if pressed or typeahead.changed.is_set():
+                        typeahead.changed.clear()
+                        live.update(self.__typeahead_view(typeahead, selected), refresh=True)
+        except KeyboardInterrupt:
+            return
+        finally:
+            typeahead.close()
+
+        from lib.match import label
+        album = "album" in query.lower()
+        link = f"https://www.deezer.com/en/album/{chosen['album']['id']}" if album else chosen["link"]
+        self.__download_chosen(link=link, title=label(chosen, album=album))
+
+    def __typeahead_view(self, typeahead: "Typeahead", selected: int) -> "Group":
+        """What `live_search` shows: the query being typed, then its results with the best match in green."""
+        from rich.console import Group
+        from lib.match import label
+
+        query, results, searching, error = typeahead.snapshot()
+        album = "album" in query
+        prompt = f"[b blue](query) ➜[reset] {query}[blink]▌[/blink]"
+        if error is not None:
+            prompt += f"  [red]{error}[reset]"
+        elif searching:
+            prompt += "  [dim]searching…[/dim]"
+
+        table = Table(title="Up/down to choose, enter to download, esc to go back:")
+        table.add_column(f"[u]Available {'Albums' if album else 'Tracks'}[/u]", justify="left")
+        names = [label(result, album=album) for result in results]
+        best_match = self.__best_match(query=query, songs=names)[0][0] if names else None
+        for index, name in enumerate(names):
+            style = "b green" if name == best_match else ""
+            if index == min(selected, len(names) - 1):
+                style += " reverse"
+            table.add_row(f"{index + 1}. {name}", style=style.strip() or None)
+        return Group(prompt, table)
+
     def set_arl(self, arl: str) -> bool:
         """
         Changes the ARL.
@@ -270,6 +805,10 @@ class Main:
         """
         with open('./config/.arl', 'w') as f:
             f.write(arl)
+        # the workers are logged in with the old ARL, and the cached account is of the old one
+        self.dzr.stop_engine()
+        self.dzr.forget_account()
+        self.arl_valid = None
         return arl == self.get_arl()
     
     def get_arl(self) -> str:
@@ -313,27 +852,105 @@ class Main:
         except ValueError:
             return "N/A"
 
+    def stats(self) -> None:
+        """
+        Prints the counters & latency histograms recorded so far (see `lib/metrics.py`), along with the rate limiter.
+        """
+        snapshot = METRICS.snapshot()
+        table = Table(title="Counters.")
+        table.add_column("Name", justify="left")
+        table.add_column("Labels", justify="left")
+        table.add_column("Value", justify="right")
+        for counter in snapshot["counters"]:
+            labels = ", ".join(f"{key}={value}" for key, value in counter["labels"].items())
+            table.add_row(counter["name"], labels, f"{counter['value']:g}")
+        for key, value in self.dzr.limiter.stats().items():
+            table.add_row(f"rate_limiter_{key}", "", f"{value:g}")
+        self.console.print(table)
+
+        table = Table(title="Histograms.")
+        table.add_column("Name", justify="left")
+        table.add_column("Labels", justify="left")
+        for column in ("Count", "Avg", "p50", "p95", "Max"):
+            table.add_column(column, justify="right")
+        for histogram in snapshot["histograms"]:
+            labels = ", ".join(f"{key}={value}" for key, value in histogram["labels"].items())
+            average = histogram["sum"] / histogram["count"] if histogram["count"] else 0
+            table.add_row(
+                histogram["name"],
+                labels,
+                str(histogram["count"]),
+                *(f"{round(value, 3):g}" for value in (average, histogram["p50"], histogram["p95"], histogram["max"]))
+            )
+        self.console.print(table)
+
+    def profile(self, command: str, deterministic: bool = False, memory: bool = False) -> list[str]:
+        """
+        Runs a command under `lib.profiler.Profiler`, writing the report & collapsed stacks to config/profiles/.
+
+        Args:
+            command (str): "sch" | "dl" | "st" | "ss" | "srt" (or their long names).
+            deterministic (bool): Defaults to False. If True, `cProfile` the command's own thread too.
+            memory (bool): Defaults to False. If True, trace the allocations with `tracemalloc`.
+
+        Returns:
+            list[str]: The files written, empty if the command isn't one which can be profiled.
+        """
+        from lib.profiler import Profiler
+
+        commands = {
+            "sch": self.search, "search": self.search,
+            "dl": self.download, "download": self.download,
+            "st": self.stream, "stream": self.stream,
+            "srt": self.ss.sort, "sort": self.ss.sort,
+        }
+        if command == "ss":
+            # the query is asked for first, so the typing isn't in the profile
+            query = self.console.input("[b blue](query) ➜[reset] ").lower()
+            commands["ss"] = lambda: self.search_query(query=query)
+        if command not in commands:
+            self.console.print(f"[b red]Can't profile '{command}', try one of: sch, dl, st, ss, srt.")
+            return []
+        with Profiler(name=command, deterministic=deterministic, memory=memory) as profiler:
+            try:
+                commands[command]()
+            except KeyboardInterrupt:
+                self.dzr.stop_engine()
+        self.console.print(f"[b green]Profiled[reset] '{command}' ({profiler.seconds:.2f}s): {', '.join(profiler.paths)}")
+        return profiler.paths
+
     def main(self) -> None:
         """
         `main` function of class `Main()`.
         This is used to allow user input and allow the user to navigate through the app!
         """
+        self.warm_up()
         self.clear()
         self.console.print(Design.main_menu())
+        warned = False
 
         # this may be messy, but i will try and make it as optimal as possible!
         while True:
+            if self.arl_valid is False and not warned:
+                # found out by `self.warm_up()` while the user was typing
+                self.console.print(self.invalid_arl_string)
+                warned = True
             check = self.console.input("[b green](menu) ➜[/b green] ").lower()
             match check:
                 case "help" | "?" | "ls" | "hh":
                     self.console.print(Design.better_help_menu())
                 case "q" | "exit" | "quit":
+                    self.dzr.stop_engine()
+                    self.stop_verifier()
                     return
                 
                 case "sch" | "search":
                     self.search()
                 
                 case "ss":
+                    if sys.stdin.isatty():
+                        self.live_search()
+                        continue
                     query = self.console.input("[b blue](query) ➜[reset] ").lower()
                     if query == "q" or query == "exit":
                         continue
@@ -347,9 +964,15 @@ class Main:
                
                 case "dl" | "download":
                     self.download()
+
+                case "st" | "stream":
+                    self.stream()
                
                 case "srt" | "sort":
                     self.ss.sort()
+
+                case "srt plan" | "sort plan":
+                    self.ss.sort(dry_run=True)
                
                 case "init":
                     self.console.print("Downloading initial file.")
@@ -361,6 +984,31 @@ class Main:
                
                 case "clear":
                     self.clear()
+
+                case "journal":
+                    counts = self.journal.counts()
+                    table = Table(title="Journal.")
+                    table.add_column("State", justify="left")
+                    table.add_column("Lines", justify="left")
+                    for state, amount in counts.items():
+                        table.add_row(state, str(amount))
+                    self.console.print(table)
+
+                case "journal reset":
+                    self.journal.reset()
+                    self.console.print("[b green]Reset[reset] the journal, the next search starts from scratch!")
+
+                case "stats":
+                    self.stats()
+
+                case "stats export":
+                    METRICS.write("config/metrics.prom")
+                    METRICS.write("config/metrics.json")
+                    self.console.print("[b green]Exported[reset] the stats to config/metrics.prom & config/metrics.json!")
+
+                case "clear cache":
+                    self.dzr.cache.clear()
+                    self.console.print("[b green]Cleared[reset] the search cache!")
                 
                 case "set timeout":
                     timeout = self.console.input("[b blue](timeout) ➜[reset] ")
@@ -369,48 +1017,97 @@ class Main:
                     try:
                         timeout = int(timeout)
                         self.timeout = timeout
-                        self.console.print(f"[b green]Set timeout to {self.timeout}")
+                        self.dzr.timeout = timeout
+                        self.console.print(f"[b green]Downloads are now stopped after {self.timeout}s without progress")
                     except ValueError:
                         self.console.print(f"[b red]Enter a number, not '{timeout}'!")
                         return
                 
+                case "set workers":
+                    workers = self.console.input("[b blue](workers) ➜[reset] ")
+                    if workers == "q":
+                        continue
+                    try:
+                        self.download_workers = max(1, int(workers))
+                        # restarted with the new amount on the next download
+                        self.dzr.stop_engine()
+                        self.console.print(f"[b green]Set download workers to {self.download_workers}")
+                    except ValueError:
+                        self.console.print(f"[b red]Enter a number, not '{workers}'!")
+
+                case "set score":
+                    score = self.console.input("[b blue](score) ➜[reset] ")
+                    if score == "q":
+                        continue
+                    try:
+                        self.dzr.min_score = min(100, max(0, float(score)))
+                        self.console.print(f"[b green]Matches scoring below {self.dzr.min_score} now go to could_not_find.txt")
+                    except ValueError:
+                        self.console.print(f"[b red]Enter a number, not '{score}'!")
+
+                case "set engine":
+                    self.use_engine = not self.use_engine
+                    if not self.use_engine:
+                        self.dzr.stop_engine()
+                    self.console.print(f"Deemix workers are now {'[b green]on' if self.use_engine else '[b red]off'}[reset]")
+
+                case "set verify":
+                    self.verify = not self.verify
+                    self.console.print(f"Checking downloads is now {'[b green]on' if self.verify else '[b red]off'}[reset]")
+
+                case "set bandwidth":
+                    bandwidth = self.console.input("[b blue](MB/s, 0 for no cap) ➜[reset] ")
+                    if bandwidth == "q":
+                        continue
+                    try:
+                        bandwidth = float(bandwidth)
+                        self.bandwidth = bandwidth * 1_000_000 if bandwidth > 0 else None
+                        if self.bandwidth is None:
+                            self.console.print("[b green]Downloads are no longer capped")
+                        else:
+                            self.console.print(f"[b green]No new download starts while they use more than {bandwidth:g} MB/s together")
+                    except ValueError:
+                        self.console.print(f"[b red]Enter a number, not '{bandwidth}'!")
+
                 case "set arl" | "arl set":
                     arl = self.console.input("[b blue](arl) ➜[reset] ")
                     if not len(arl) == 192:
                         self.console.print("Incorrect ARL length!")
                         continue
-                    with self.console.status("Checking ARL...") as _:
-                        if self.dzr.account_info(check_only=True):
-                            self.console.print("ARL [b green]valid[reset]!")
-                        else:
-                            self.console.print("ARL is [b red]not valid[reset]!")
                     check = self.set_arl(arl=arl)
                     if check:
                         self.console.print("ARL set [b green]successfully[reset]!")
                     else:
                         self.console.print("Could [b red]not[reset] set the ARL!")
+                        continue
+                    # checks the new ARL, and caches it for `arl info` & the downloads
+                    with self.console.status("Checking ARL...") as _:
+                        self.arl_valid = self.dzr.account().valid
+                    if self.arl_valid:
+                        self.console.print("ARL [b green]valid[reset]!")
+                    else:
+                        self.console.print("ARL is [b red]not valid[reset]!")
                 
                 case "arl info":
-                    info = self.dzr.account_info()
-                    if isinstance(info, str):
-                        # !! ONLY returns str if INVALID ARL
+                    account = self.dzr.account()
+                    if not account.valid:
                         self.console.print("[b red]ARL is invalid![reset]")
                         continue
                     table = Table(title="Account Information.")
                     table.add_column("Option", justify="left")
                     table.add_column("Value", justify="left")
-                    table.add_row("First Name", self.dzr.firstname)
-                    table.add_row("Last Name", self.dzr.lastname)
-                    table.add_row("Email", self.dzr.email)
-                    table.add_row("Country Code", self.dzr.country)
+                    table.add_row("First Name", account.firstname)
+                    table.add_row("Last Name", account.lastname)
+                    table.add_row("Email", account.email)
+                    table.add_row("Country Code", account.country)
                     table.add_section()
-                    table.add_row("Plan", self.dzr.plan)
-                    table.add_row("Date Start", self.dzr.date_start)
-                    table.add_row("Date End", self.dzr.date_end)
-                    table.add_row("Days Left", self.__get_days(end_date=self.dzr.date_end))
-                    table.add_row("Lossless Active?", "[b green]Yes[reset]" if self.dzr.is_lossless else "[b red]No[reset]")
+                    table.add_row("Plan", account.plan)
+                    table.add_row("Date Start", account.date_start)
+                    table.add_row("Date End", account.date_end)
+                    table.add_row("Days Left", self.__get_days(end_date=account.date_end))
+                    table.add_row("Lossless Active?", "[b green]Yes[reset]" if account.is_lossless else "[b red]No[reset]")
                     self.console.print(table)
-                    if self.dzr.date_start == "0000-00-00" or self.dzr.date_end == "0000-00-00":
+                    if account.date_start == "0000-00-00" or account.date_end == "0000-00-00":
                         self.console.print("Consider [b yellow]changing[reset] your ARL!")
 
                 case "get arl":
@@ -446,9 +1143,19 @@ class Main:
                                         new_value = False
                                     self.settings(option=key, value=new_value)
 
+                case _ if check.startswith("profile "):
+                    words = check.split()[1:]
+                    options = {"cprofile", "memory"}
+                    command = " ".join(word for word in words if word not in options)
+                    self.profile(command=command, deterministic="cprofile" in words, memory="memory" in words)
+
                 case _:
                     pass
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # headless, e.g. `python main.py run --songs songs.txt --sort`
+        from lib.cli import main as cli
+        sys.exit(cli(sys.argv[1:], app=Main))
     Main(bitrate="FLAC").main()
@@ -0,0 +1,55 @@
+"""
+test_scheduler.py -> `lib.scheduler.DownloadScheduler`'s order & bandwidth cap, run with `python -m pytest tests/`.
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib.scheduler as scheduler
+from lib.scheduler import DownloadScheduler, INTERACTIVE, OK
+
+
+def test_bandwidth_cap_holds_back_idle_workers(monkeypatch):
+    monkeypatch.setattr(scheduler, "SETTLE", 0.05)
+    lock = threading.Lock()
+    running = 0
+    most = 0
+
+    def download(link: str) -> str:
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.3)
+        with lock:
+            running -= 1
+        return OK
+
+    # each download uses 1 MB/s, the cap lets a second one start but not a third
+    links = [f"https://www.deezer.com/track/{index}" for index in range(6)]
+    downloads = DownloadScheduler(download=download, workers=4, bandwidth=1_500_000, throughput=lambda: running * 1_000_000)
+    # started before the links come in, so every worker is already waiting on the queue
+    downloads.start()
+    time.sleep(0.05)
+    for link in links:
+        downloads.submit(link)
+    results = downloads.join()
+    assert most == 2
+    assert all(results[link] == OK for link in links)
+
+
+def test_interactive_then_shortest_first():
+    order = []
+    downloads = DownloadScheduler(download=lambda link: order.append(link) or OK, workers=1)
+    downloads.submit("https://www.deezer.com/album/1")
+    downloads.submit("https://www.deezer.com/track/2")
+    downloads.submit("https://www.deezer.com/album/3")
+    # promoted, instead of queued twice
+    downloads.submit("https://www.deezer.com/album/3", priority=INTERACTIVE)
+    downloads.start()
+    downloads.join()
+    assert order == ["https://www.deezer.com/album/3", "https://www.deezer.com/track/2", "https://www.deezer.com/album/1"]
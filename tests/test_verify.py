@@ -0,0 +1,88 @@
+"""
+test_verify.py -> `lib.verify.Verifier` on the lines real Deemix prints, run with `python -m pytest tests/`.
+"""
+
+import os
+import sys
+
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import fake_flac
+from lib.progress import ProgressTracker, parse_line
+from lib.verify import Verifier, resolve
+
+LINK = "https://www.deezer.com/album/302127"
+
+
+@pytest.fixture
+def verifier(tmp_path):
+    durations = {}
+    dzr = SimpleNamespace(music_dir=str(tmp_path), progress=ProgressTracker(), durations=lambda link: durations)
+    verifier = Verifier(dzr=dzr, workers=1)
+    verifier.durations = durations
+    yield verifier
+    verifier.close()
+
+
+def write(folder, name: str, duration: float = 180) -> str:
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(fake_flac("Artist", "Title", duration=duration, padding=64, audio=True))
+    return path
+
+
+def downloaded(verifier: Verifier, *names: str) -> None:
+    """Feeds what `deemix.utils.formatListener` prints once a track of the album is written."""
+    for name in names:
+        for event in parse_line(f"[album_302127_9] Completed download of /{name}"):
+            verifier.dzr.progress.feed(LINK, event)
+    verifier.dzr.progress.done(LINK)
+
+
+def test_relative_path_in_album_folder(verifier, tmp_path):
+    path = write(tmp_path / "Daft Punk - Discovery", "01 - One More Time.flac")
+    downloaded(verifier, "01 - One More Time.flac")
+    assert verifier.check(LINK) is True
+    assert os.path.exists(path)
+    assert verifier.failures == {}
+
+
+def test_relative_path_of_single(tmp_path):
+    path = write(tmp_path, "Daft Punk - One More Time.flac")
+    assert resolve("/Daft Punk - One More Time.flac", root=str(tmp_path)) == path
+
+
+def test_missing_file_is_skipped(verifier):
+    downloaded(verifier, "01 - Nowhere.flac")
+    assert verifier.check(LINK) is True
+
+
+def test_cut_off_file_is_deleted(verifier, tmp_path):
+    path = write(tmp_path / "Daft Punk - Discovery", "02 - Aerodynamic.flac")
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 100)
+    downloaded(verifier, "02 - Aerodynamic.flac")
+    assert verifier.check(LINK) is False
+    assert not os.path.exists(path)
+
+
+def test_duration_of_sanitized_title(verifier, tmp_path):
+    verifier.durations.update({"What's Up?": 180, "Up": 30})
+    path = write(tmp_path / "4 Non Blondes - Bigger", "02 - What's Up_.flac", duration=180)
+    downloaded(verifier, "02 - What's Up_.flac")
+    assert verifier.check(LINK) is True
+    assert verifier.failures == {}
+
+
+def test_duration_mismatch_is_kept(verifier, tmp_path):
+    verifier.durations.update({"Up": 180, "Down": 200})
+    path = write(tmp_path / "Artist - Album", "01 - Up.flac", duration=30)
+    downloaded(verifier, "01 - Up.flac")
+    assert verifier.check(LINK) is True
+    assert os.path.exists(path)
+    assert "Deezer says 180s" in verifier.failures[path]